@@ -0,0 +1,99 @@
+# Throughput of the clean_data steps before and after vectorization on a synthetic form export
+# Run from the repository root: python -m benchmarks.bench_clean_data [rows]
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import clean_data
+
+FORM_FILE = "movie_form_response_july04.csv"
+DEFAULT_ROWS = 1_000_000
+
+
+def synthetic_form(rows, seed=42):
+    """A form export of the given size, each column drawn from the answers in the real export"""
+    rng = np.random.default_rng(seed)
+    form = pd.read_csv(FORM_FILE)
+    return pd.DataFrame({col: form[col].to_numpy()[rng.integers(0, len(form), rows)] for col in form.columns})
+
+
+# The row-by-row implementations these benchmarks compare against
+
+def legacy_clean_name_column(df):
+    if "Name" in df.columns:
+        df["Name"] = df["Name"].apply(lambda x: x.split()[0] if pd.notna(x) else x)
+    return df
+
+
+def legacy_clean_genre_preferences(df):
+    genre_columns = [col for col in df.columns if col.startswith('Genre_')]
+    for col in genre_columns:
+        genre_name = col.replace('Genre_', '')
+        new_col_name = f"Genre_Rating_{genre_name}"
+        df[new_col_name] = df[col].apply(lambda x:
+            5 if 'Love' in str(x) else
+            4 if 'Like' in str(x) and 'Dislike' not in str(x) else
+            3 if 'Neutral' in str(x) else
+            2 if 'Dislike' in str(x) else
+            1 if 'Hate' in str(x) else
+            np.nan
+        )
+    return df
+
+
+def legacy_clean_movie_ratings(df):
+    movie_columns = [col for col in df.columns if col.startswith('Rating_')]
+    for col in movie_columns:
+        movie_name = col.replace('Rating_', '')
+        new_col_name = f"Movie_Rating_{movie_name}"
+        df[new_col_name] = pd.to_numeric(df[col], errors='coerce')
+        median_rating = df[new_col_name].median()
+        df[new_col_name] = df[new_col_name].fillna(median_rating)
+    return df
+
+
+def legacy_clean_text_responses(df, columns):
+    for col in columns:
+        if col in df.columns:
+            df[col] = df[col].astype(str).apply(lambda x: x.strip().title() if pd.notna(x) and x.strip() != "" else "Not Provided")
+    return df
+
+
+def timed(function, df, *args):
+    start = time.perf_counter()
+    result = function(df, *args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS
+    print(f"Building a synthetic form export with {rows:,} responses...")
+    raw = synthetic_form(rows)
+    renamed = clean_data.rename_columns(raw.copy())
+
+    steps = [
+        ("name", legacy_clean_name_column, clean_data.clean_name_column, renamed, ()),
+        ("genres", legacy_clean_genre_preferences, clean_data.clean_genre_preferences, renamed, ()),
+        ("movie ratings", legacy_clean_movie_ratings, clean_data.clean_movie_ratings, renamed, ()),
+    ]
+
+    print(f"\n{'step':<16}{'before s':>10}{'after s':>10}{'rows/s before':>16}{'rows/s after':>16}{'speedup':>10}")
+    for label, before, after, source, args in steps:
+        expected, before_seconds = timed(before, source.copy(), *args)
+        result, after_seconds = timed(after, source.copy(), *args)
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+        print(f"{label:<16}{before_seconds:>10.2f}{after_seconds:>10.2f}{rows / before_seconds:>16,.0f}"
+              f"{rows / after_seconds:>16,.0f}{before_seconds / after_seconds:>9.1f}x")
+
+    # clean_text_responses works on the original question columns
+    expected, before_seconds = timed(legacy_clean_text_responses, raw.copy(), clean_data.TEXT_COLUMNS)
+    result, after_seconds = timed(clean_data.clean_text_responses, raw.copy())
+    pd.testing.assert_frame_equal(result, expected)
+    print(f"{'text':<16}{before_seconds:>10.2f}{after_seconds:>10.2f}{rows / before_seconds:>16,.0f}"
+          f"{rows / after_seconds:>16,.0f}{before_seconds / after_seconds:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
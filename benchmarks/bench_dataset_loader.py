@@ -0,0 +1,70 @@
+# Compare the old iterrows loaders with the columnar dataset_loader
+# Run from the repository root: python -m benchmarks.bench_dataset_loader
+import time
+
+import pandas as pd
+
+import dataset_loader
+from dataset_loader import (DATASET_FOLDER, discord_user_mapping, measure_load, movie_title_mapping, read_movies,
+                            read_users)
+
+
+def iterrows_users():
+    """The original load_users body"""
+    mapping = {}
+    df_users = pd.read_csv(f"{DATASET_FOLDER}/u.user",
+                           sep="|",
+                           names=["userID", "age", "gender", "username", "discordID"])
+    discord_users = df_users[df_users["gender"] == "D"]
+    for index, row in discord_users.iterrows():
+        mapping[int(row['discordID'])] = row['userID']
+    return mapping
+
+
+def iterrows_movies():
+    """The original load_movies body"""
+    mapping = {}
+    df_movies = pd.read_csv(f"{DATASET_FOLDER}/u.item",
+                            usecols=[0, 1],
+                            sep="|",
+                            names=["movieID", "title"],
+                            encoding='ISO-8859-1')
+    for index, row in df_movies.iterrows():
+        mapping[int(row['movieID'])] = row['title']
+    return mapping
+
+
+def columnar_users():
+    return discord_user_mapping(read_users(f"{DATASET_FOLDER}/u.user"))
+
+
+def columnar_movies():
+    return movie_title_mapping(read_movies(f"{DATASET_FOLDER}/u.item"))
+
+
+def best_of(function, repeats=5):
+    """Fastest of several runs in milliseconds"""
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1000)
+    return min(samples)
+
+
+def main():
+    dataset_loader.TRACE_LOAD_MEMORY = True
+    print("Peak memory per loader:")
+    for label, function in [("iterrows u.user", iterrows_users), ("columnar u.user", columnar_users),
+                            ("iterrows u.item", iterrows_movies), ("columnar u.item", columnar_movies)]:
+        measure_load(label, function)
+
+    print(f"\n{'file':<10}{'iterrows ms':>14}{'columnar ms':>14}{'speedup':>10}")
+    for label, old, new in [("u.user", iterrows_users, columnar_users), ("u.item", iterrows_movies, columnar_movies)]:
+        old_ms = best_of(old)
+        new_ms = best_of(new)
+        print(f"{label:<10}{old_ms:>14.1f}{new_ms:>14.1f}{old_ms / new_ms:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# "Did you mean" lookups: the FuzzyIndex deletion index against brute-force fuzz.ratio over every title
+# Run from the repository root: python -m benchmarks.bench_fuzzy_index
+import random
+import statistics
+import time
+
+from fuzzywuzzy import fuzz
+
+from dataset_loader import DATASET_FOLDER, movie_title_mapping, read_movies
+from fuzzy_index import FuzzyIndex, title_words
+from title_index import normalize_title
+
+QUERY_COUNT = 200
+LIMIT = 5
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def misspell(word, rng):
+    """word with one random insert, delete, substitution or swap"""
+    if len(word) < 4:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    edit = rng.choice(["insert", "delete", "substitute", "swap"])
+    if edit == "insert":
+        return word[:i] + rng.choice(LETTERS) + word[i:]
+    if edit == "delete":
+        return word[:i] + word[i + 1:]
+    if edit == "substitute":
+        return word[:i] + rng.choice(LETTERS) + word[i + 1:]
+    return word[:i - 1] + word[i] + word[i - 1] + word[i + 1:]
+
+
+def typo_queries(titles, count, seed=42):
+    """(movie id, query) pairs: the first words of a real title with one word misspelled"""
+    rng = random.Random(seed)
+    queries = []
+    for movie in rng.sample(sorted(titles), len(titles)):
+        if len(queries) == count:
+            break
+        words = [word for word in title_words(normalize_title(titles[movie])) if not word.isdigit()][:3]
+        if not words:
+            continue
+        target = rng.randrange(len(words))
+        words[target] = misspell(words[target], rng)
+        queries.append((movie, " ".join(words)))
+    return queries
+
+
+def brute_force(normalized, query, limit=LIMIT):
+    """Score every title with fuzz.ratio and keep the best"""
+    query = normalize_title(query)
+    scored = sorted(((fuzz.ratio(query, text), movie) for movie, text in normalized.items()), reverse=True)
+    return [movie for score, movie in scored[:limit]]
+
+
+def run(label, search, queries):
+    times, hits = [], 0
+    for movie, query in queries:
+        start = time.perf_counter()
+        results = search(query)
+        times.append((time.perf_counter() - start) * 1000)
+        hits += movie in results
+    times.sort()
+    print(f"{label:<22}{statistics.median(times):>12.3f}{times[int(len(times) * 0.99) - 1]:>12.3f}"
+          f"{hits / len(queries):>12.2%}")
+
+
+def main():
+    titles = movie_title_mapping(read_movies(f"{DATASET_FOLDER}/u.item"))
+    normalized = {movie: normalize_title(title) for movie, title in titles.items()}
+
+    start = time.perf_counter()
+    index = FuzzyIndex.build(titles)
+    print(f"FuzzyIndex over {len(titles):,} titles built in {time.perf_counter() - start:.2f}s "
+          f"({len(index.variant_words):,} deletion variants)")
+
+    queries = typo_queries(titles, QUERY_COUNT)
+    print(f"{len(queries)} queries, e.g. {[query for movie, query in queries[:4]]}")
+    print(f"\n{'matcher':<22}{'median ms':>12}{'p99 ms':>12}{'hit@5':>12}")
+    run("FuzzyIndex", lambda query: index.suggest(query, LIMIT), queries)
+    run("fuzz.ratio brute force", lambda query: brute_force(normalized, query), queries)
+
+
+if __name__ == "__main__":
+    main()
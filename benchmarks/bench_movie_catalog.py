@@ -0,0 +1,93 @@
+# Memory and lookup speed of MovieCatalog against the {movie id: title} dict it replaced
+# Run from the repository root: python -m benchmarks.bench_movie_catalog
+import gc
+import random
+import time
+import tracemalloc
+
+import pandas as pd
+
+from dataset_loader import DATASET_FOLDER, movie_title_mapping, read_movie_genres, read_movies
+from movie_catalog import MovieCatalog
+
+SCALES = [1, 10]
+LOOKUPS = 200_000
+
+
+def retained(build, *args):
+    """(result of build(*args), bytes still allocated once it returns and temporaries are freed)"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build(*args)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, size
+
+
+def scaled_frames(scale):
+    """u.item movies and genres repeated `scale` times, with the movie ids shifted per copy"""
+    df_movies = read_movies(f"{DATASET_FOLDER}/u.item")
+    df_genres = read_movie_genres(f"{DATASET_FOLDER}/u.item")
+    offset = int(df_movies["movieID"].max()) + 1
+    # copies get their own title strings, as distinct movies would
+    copies = [(df_movies.assign(movieID=df_movies["movieID"] + copy * offset,
+                                title=df_movies["title"] + (f" #{copy}" if copy else "")),
+               df_genres.assign(movieID=df_genres["movieID"] + copy * offset)) for copy in range(scale)]
+    return (pd.concat([movies for movies, genres in copies], ignore_index=True),
+            pd.concat([genres for movies, genres in copies], ignore_index=True))
+
+
+# What each structure keeps after a load, once the frames it was read from are gone
+
+
+def load_dict(scale):
+    return movie_title_mapping(scaled_frames(scale)[0])
+
+
+def load_catalog(scale):
+    return MovieCatalog.from_frames(*scaled_frames(scale))
+
+
+def time_lookups(label, mapping, keys):
+    start = time.perf_counter()
+    for key in keys:
+        mapping[key]
+    lookup = (time.perf_counter() - start) / len(keys) * 1e9
+    start = time.perf_counter()
+    for key in keys:
+        -key in mapping
+    missing = (time.perf_counter() - start) / len(keys) * 1e9
+    start = time.perf_counter()
+    for key, title in mapping.items():
+        pass
+    walk = (time.perf_counter() - start) * 1000
+    print(f"{label:<10}{lookup:>14.0f}{missing:>14.0f}{walk:>14.1f}")
+
+
+def main():
+    for scale in SCALES:
+        mapping, plain = retained(load_dict, scale)
+        catalog, compact = retained(load_catalog, scale)
+        movies, genres = scaled_frames(scale)
+        start = time.perf_counter()
+        MovieCatalog.from_frames(movies, genres)
+        build = time.perf_counter() - start
+        assert dict(catalog.items()) == mapping
+
+        count = len(catalog)
+        print(f"\n{count:,} movies (u.item x{scale}), catalog built in {build * 1000:.0f} ms")
+        print(f"dict of ints and strings: {plain / 2 ** 20:8.2f} MiB ({plain / count:.0f} bytes per movie)")
+        print(f"MovieCatalog:             {compact / 2 ** 20:8.2f} MiB ({compact / count:.0f} bytes per movie, "
+              f"{catalog.buffer.nbytes / count:.0f} of them title text, genres included)")
+        print(f"saved per process:        {(plain - compact) / 2 ** 20:8.2f} MiB ({1 - compact / plain:.0%})")
+
+        keys = random.Random(42).choices(list(mapping), k=LOOKUPS)
+        print(f"\n{'':<10}{'lookup ns':>14}{'miss ns':>14}{'items() ms':>14}")
+        time_lookups("dict", mapping, keys)
+        time_lookups("catalog", catalog, keys)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# Recall@10 and latency of the LSH SimilarityIndex against brute-force cosine similarity
+# Run from the repository root: python -m benchmarks.bench_similarity_index
+import os
+import statistics
+import time
+
+import numpy as np
+
+from dataset_loader import DATASET_FOLDER, GENRE_NAMES, read_movie_genres
+from model_service import MODEL_FILE, MODEL_LAYOUT, FactorModel, saved_layout
+from similarity_index import SimilarityIndex
+
+K = 10
+QUERY_COUNT = 500
+# (n_tables, probes) settings swept for the recall/latency trade-off
+SETTINGS = [(4, 0), (8, 0), (8, 2), (16, 0), (16, 2), (16, 4)]
+
+
+def recall_at_k(approximate, exact):
+    """Share of approximate results scoring at least as well as the k-th exact result.
+
+    Comparing scores rather than ids keeps ties (common with genre vectors)
+    from counting as misses.
+    """
+    if not exact:
+        return 1.0
+    threshold = exact[-1][1] - 1e-6
+    return sum(1 for item, score in approximate if score >= threshold) / len(exact)
+
+
+def evaluate(label, ids, vectors):
+    print(f"\n=== {label}: {len(ids):,} items, {vectors.shape[1]} dimensions ===")
+    rng = np.random.default_rng(42)
+    queries = rng.choice(ids, size=min(QUERY_COUNT, len(ids)), replace=False).tolist()
+
+    baseline = SimilarityIndex(ids, vectors)
+    exact = {}
+    brute_times = []
+    for item in queries:
+        start = time.perf_counter()
+        exact[item] = baseline.brute_force(item, K)
+        brute_times.append((time.perf_counter() - start) * 1000)
+    print(f"brute force: median {statistics.median(brute_times):.3f} ms")
+
+    print(f"{'tables':>8}{'probes':>8}{'build s':>10}{'recall@10':>12}{'median ms':>12}{'p99 ms':>10}")
+    for n_tables, probes in SETTINGS:
+        start = time.perf_counter()
+        index = SimilarityIndex(ids, vectors, n_tables=n_tables)
+        build_seconds = time.perf_counter() - start
+
+        recalls, times = [], []
+        for item in queries:
+            start = time.perf_counter()
+            approximate = index.similar(item, K, probes=probes)
+            times.append((time.perf_counter() - start) * 1000)
+            recalls.append(recall_at_k(approximate, exact[item]))
+        print(f"{n_tables:>8}{probes:>8}{build_seconds:>10.2f}{statistics.mean(recalls):>12.3f}"
+              f"{statistics.median(times):>12.3f}{np.percentile(times, 99):>10.3f}")
+
+
+def main():
+    genres = read_movie_genres(f"{DATASET_FOLDER}/u.item")
+    evaluate("u.item genre flags", genres["movieID"].to_numpy(), genres[GENRE_NAMES].to_numpy())
+
+    if os.path.exists(MODEL_FILE) and saved_layout(MODEL_FILE) == MODEL_LAYOUT:
+        model = FactorModel.load(MODEL_FILE)
+        evaluate("SVD item factors", model.item_ids, model.item_factors)
+    else:
+        print(f"\nNo current {MODEL_FILE}, skipping the SVD item factor run (train one with model_service.py)")
+
+
+if __name__ == "__main__":
+    main()
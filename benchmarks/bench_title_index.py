@@ -0,0 +1,80 @@
+# Compare the old linear scan in recommender.search with the trigram TitleIndex
+# Run from the repository root: python -m benchmarks.bench_title_index
+import random
+import statistics
+import time
+
+from title_index import TitleIndex
+
+DATASET_FOLDER = "ml-from-2015"
+SYNTHETIC_SIZE = 1_000_000
+QUERIES = ["star wars", "the", "avengers", "lord of the", "love", "2015", "zzzz", "man"]
+REPEATS = 5
+# Ranked results kept when a caller caps the result set
+RESULT_LIMIT = 25
+
+
+def read_titles():
+    """Read {movieID: title} straight from u.item without pandas"""
+    titles = {}
+    with open(f"{DATASET_FOLDER}/u.item", encoding="ISO-8859-1") as item_file:
+        for line in item_file:
+            fields = line.split("|", 2)
+            titles[int(fields[0])] = fields[1]
+    return titles
+
+
+def synthetic_titles(titles, size, seed=42):
+    """Build size fake titles by recombining words from the real ones"""
+    rng = random.Random(seed)
+    words = [word for title in titles.values() for word in title.split()]
+    return {movie: " ".join(rng.choices(words, k=rng.randint(1, 6))) for movie in range(1, size + 1)}
+
+
+def linear_scan(titles, query):
+    """The pre-index search loop, minus the ctx.send calls"""
+    matches = []
+    for movie in titles:
+        if str(query).lower() in str(titles[movie]).lower():
+            matches.append(movie)
+    return matches
+
+
+def time_queries(search):
+    """Median milliseconds per query for each query"""
+    results = {}
+    for query in QUERIES:
+        samples = []
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            search(query)
+            samples.append((time.perf_counter() - start) * 1000)
+        results[query] = statistics.median(samples)
+    return results
+
+
+def run(titles, label):
+    print(f"\n=== {label}: {len(titles):,} titles ===")
+    start = time.perf_counter()
+    index = TitleIndex(titles)
+    print(f"Index build time: {time.perf_counter() - start:.2f}s")
+
+    scan_times = time_queries(lambda query: linear_scan(titles, query))
+    index_times = time_queries(index.search)
+    limited_times = time_queries(lambda query: index.search(query, limit=RESULT_LIMIT))
+    print(f"{'query':<14}{'matches':>10}{'scan ms':>12}{'index ms':>12}{'top-25 ms':>12}{'speedup':>10}")
+    for query in QUERIES:
+        matches = len(index.search(query))
+        speedup = scan_times[query] / max(index_times[query], 1e-6)
+        print(f"{query:<14}{matches:>10,}{scan_times[query]:>12.3f}{index_times[query]:>12.3f}"
+              f"{limited_times[query]:>12.3f}{speedup:>9.1f}x")
+
+
+def main():
+    titles = read_titles()
+    run(titles, "u.item")
+    run(synthetic_titles(titles, SYNTHETIC_SIZE), "synthetic")
+
+
+if __name__ == "__main__":
+    main()
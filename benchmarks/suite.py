@@ -0,0 +1,282 @@
+# Time and peak memory of the bot's data and recommendation hot paths at several dataset sizes
+# Run from the repository root: python -m benchmarks.suite [--scales 1 4] [--save-baseline]
+#
+# Every case runs in its own process inside a temporary folder holding synthetic data scaled
+# from ml-from-2015, so no repository file is touched. Memory is how far RSS peaks above where
+# it stood once the case's imports and setup were done, so it covers the timed call alone.
+# Dataset loads start without snapshots, as on a fresh deploy. The run fails (exit code 1)
+# when a case is slower or bigger than the stored baseline by more than the thresholds.
+import argparse
+import asyncio
+import contextlib
+import gc
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_clean_data import synthetic_form
+from dataset_loader import DATASET_FOLDER
+
+BASELINE_FILE = "benchmarks/baseline.json"
+DEFAULT_SCALES = [1, 4]
+# A case regresses when it takes this much longer, or peaks this much higher, than its baseline
+TIME_THRESHOLD = 0.5
+MEMORY_THRESHOLD = 0.2
+# Seconds and MiB a case may always grow by, so small cases do not fail on noise
+TIME_SLACK = 0.05
+MEMORY_SLACK = 5
+REPEATS = 5
+
+# Sizes at scale 1; u.user and u.item are the real files repeated `scale` times
+RATINGS_PER_SCALE = 200_000
+FORM_ROWS_PER_SCALE = 10_000
+TRAIN_RATINGS_PER_SCALE = 20_000
+TOP_N_USERS = 1000
+SEARCH_QUERIES = ["star wars", "the", "avengers", "lord of the", "love", "2015", "zzzz", "man"]
+SEARCH_ROUNDS = 20
+
+
+def repeat_rows(source, target, scale, id_offset, discord_column=None):
+    """Write source `scale` times with ids shifted by id_offset per copy (and Discord ids too, so they stay unique)"""
+    with open(source, encoding="ISO-8859-1") as source_file:
+        lines = [line.rstrip("\n").split("|") for line in source_file if line.strip()]
+    with open(target, "w", encoding="ISO-8859-1") as target_file:
+        for copy in range(scale):
+            for fields in lines:
+                fields = list(fields)
+                fields[0] = str(int(fields[0]) + copy * id_offset)
+                if discord_column is not None and copy and fields[2] == "D":
+                    fields[discord_column] = str(int(fields[discord_column]) + copy)
+                target_file.write("|".join(fields) + "\n")
+
+
+def generate(folder, scale, seed=42):
+    """Synthetic copies of every input file the cases read, `scale` times the base size"""
+    data_folder = os.path.join(folder, DATASET_FOLDER)
+    os.makedirs(data_folder, exist_ok=True)
+    users = pd.read_csv(f"{DATASET_FOLDER}/u.user", sep="|", header=None, usecols=[0])[0]
+    movies = pd.read_csv(f"{DATASET_FOLDER}/u.item", sep="|", header=None, usecols=[0], encoding="ISO-8859-1")[0]
+    user_offset, movie_offset = int(users.max()) + 1, int(movies.max()) + 1
+    repeat_rows(f"{DATASET_FOLDER}/u.user", f"{data_folder}/u.user", scale, user_offset, discord_column=4)
+    repeat_rows(f"{DATASET_FOLDER}/u.item", f"{data_folder}/u.item", scale, movie_offset)
+
+    rng = np.random.default_rng(seed)
+    size = RATINGS_PER_SCALE * scale
+    user_ids = np.concatenate([users.to_numpy() + copy * user_offset for copy in range(scale)])
+    movie_ids = np.concatenate([movies.to_numpy() + copy * movie_offset for copy in range(scale)])
+    pd.DataFrame({
+        "userId": rng.choice(user_ids, size),
+        "movieId": rng.choice(movie_ids, size),
+        "rating": rng.integers(1, 11, size) / 2,
+        "timestamp": rng.integers(1_000_000_000, 1_700_000_000, size),
+    }).to_csv(f"{data_folder}/ratings.csv", index=False)
+
+    synthetic_form(FORM_ROWS_PER_SCALE * scale, seed).to_csv(f"{folder}/movie_form_response_july04.csv", index=False)
+
+
+class FakeContext:
+    """Just enough of commands.Context for a command callback to run"""
+
+    class author:
+        id = 1
+        name = display_name = "benchmark"
+
+    async def send(self, *args, **kwargs):
+        return self
+
+
+def training_frame(scale):
+    from ratings_stream import to_surprise_frame
+    ratings = pd.read_csv(f"{DATASET_FOLDER}/ratings.csv", nrows=TRAIN_RATINGS_PER_SCALE * scale)
+    return to_surprise_frame(ratings)
+
+
+# Each case does its untimed setup and returns the function to time
+
+
+def case_load_users(scale):
+    import recommender
+    return recommender.load_users
+
+
+def case_load_movies(scale):
+    import recommender
+    return recommender.load_movies
+
+
+def case_load_ratings(scale):
+    import recommender
+    return recommender.load_ratings
+
+
+def case_search(scale):
+    import recommender
+    # through the registry, so the command does not answer "still warming up"
+    recommender.DATASETS.get("movies")
+    ctx = FakeContext()
+
+    async def search_all():
+        for _ in range(SEARCH_ROUNDS):
+            for query in SEARCH_QUERIES:
+                recommender.SEARCH_RESULTS_CACHE.clear()
+                await recommender.search.callback(ctx, movie_name=query)
+
+    return lambda: asyncio.run(search_all())
+
+
+def case_clean_data(scale):
+    import clean_data
+
+    def run():
+        sys.argv = ["clean_data.py"]
+        clean_data.main()
+
+    return run
+
+
+def case_train_svd(scale):
+    from model_service import train_model
+    frame = training_frame(scale)
+    return lambda: train_model(frame)
+
+
+def case_top_n(scale):
+    from model_service import train_model
+    model = train_model(training_frame(scale))
+    users = np.random.default_rng(42).choice(model.user_ids, TOP_N_USERS).tolist()
+
+    def run():
+        for user in users:
+            model.recommend(user, 10)
+
+    return run
+
+
+CASES = {
+    "load_users": case_load_users,
+    "load_movies": case_load_movies,
+    "load_ratings": case_load_ratings,
+    "search": case_search,
+    "clean_data": case_clean_data,
+    "train_svd": case_train_svd,
+    "top_n": case_top_n,
+}
+
+
+def status_mb(field):
+    """A memory field of /proc/self/status (VmRSS, VmHWM) in MiB"""
+    with open("/proc/self/status") as status_file:
+        for line in status_file:
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1]) / 1024
+    raise KeyError(field)
+
+
+def run_case(name, scale):
+    """Child process side: time one case and print its result as JSON"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        function = CASES[name](scale)
+        gc.collect()
+        before = status_mb("VmRSS")
+        # restart the peak (VmHWM) from the current RSS, so imports and setup do not count
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        start = time.perf_counter()
+        function()
+        seconds = time.perf_counter() - start
+        memory_mb = status_mb("VmHWM") - before
+    print(json.dumps({"seconds": seconds, "memory_mb": memory_mb}))
+
+
+def measure(name, scale, folder, repeats):
+    """Fastest time and smallest memory growth over `repeats` fresh processes"""
+    repository = os.getcwd()
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [repository, os.environ.get("PYTHONPATH")])))
+    samples = []
+    for _ in range(repeats):
+        shutil.rmtree(os.path.join(folder, DATASET_FOLDER, ".snapshot"), ignore_errors=True)
+        output = subprocess.run([sys.executable, "-m", "benchmarks.suite", "--run-case", name, "--scale", str(scale)],
+                                cwd=folder, env=env, capture_output=True, text=True, check=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {"seconds": min(sample["seconds"] for sample in samples),
+            "memory_mb": min(sample["memory_mb"] for sample in samples)}
+
+
+def read_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as baseline_file:
+        return json.load(baseline_file)
+
+
+def compare(results, baseline, time_threshold, memory_threshold):
+    """Print every result next to its baseline and return the keys that regressed"""
+    regressions = []
+    print(f"\n{'case':<22}{'seconds':>10}{'base s':>10}{'MiB':>10}{'base MiB':>10}  status")
+    for key, result in results.items():
+        base = baseline.get(key)
+        status = "new"
+        if base:
+            slower = result["seconds"] > max(base["seconds"] * (1 + time_threshold), base["seconds"] + TIME_SLACK)
+            allowed = max(base["memory_mb"] * (1 + memory_threshold), base["memory_mb"] + MEMORY_SLACK)
+            bigger = result["memory_mb"] > allowed
+            status = "REGRESSED" if slower or bigger else "ok"
+            if slower or bigger:
+                regressions.append(key)
+        print(f"{key:<22}{result['seconds']:>10.3f}{base['seconds'] if base else float('nan'):>10.3f}"
+              f"{result['memory_mb']:>10.1f}{base['memory_mb'] if base else float('nan'):>10.1f}  {status}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bot's data and recommendation hot paths")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES, help="dataset size multipliers")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--repeats", type=int, default=REPEATS, help="processes per case, the best one counts")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--time-threshold", type=float, default=TIME_THRESHOLD)
+    parser.add_argument("--memory-threshold", type=float, default=MEMORY_THRESHOLD)
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    parser.add_argument("--scale", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        run_case(args.run_case, args.scale)
+        return
+
+    results = {}
+    for scale in args.scales:
+        with tempfile.TemporaryDirectory(prefix="bench-") as folder:
+            print(f"Generating scale {scale} data...")
+            generate(folder, scale)
+            for name in args.cases:
+                key = f"{name}@{scale}"
+                results[key] = measure(name, scale, folder, args.repeats)
+                print(f"{key}: {results[key]['seconds']:.3f}s, {results[key]['memory_mb']:.1f} MiB")
+
+    baseline = read_baseline(args.baseline)
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+        print(f"Saved the baseline to {args.baseline}")
+        return
+
+    regressions = compare(results, baseline, args.time_threshold, args.memory_threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regressions: {', '.join(regressions)}")
+        sys.exit(1)
+    print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,17 @@
+import argparse
+import contextlib
+import io
+import tempfile
+from collections import Counter, defaultdict
+
 import pandas as pd
 import numpy as np
 
+from rating_matrix import RATING_MATRIX_FILE, RatingMatrix, RatingMatrixWriter
+
+# Rows read at a time in streaming mode
+CHUNK_SIZE = 50_000
+
 def load_data(file_path):
     """Load the CSV data into a pandas DataFrame"""
     print("Step 1: Loading the data...")
@@ -17,18 +28,28 @@ def display_info(df, message):
     print(df.head(3))  # Show first 3 rows
     print("\n")
 
+def map_distinct(series, function):
+    """Apply function once per distinct value of a Series instead of once per row; missing values stay missing"""
+    codes, values = pd.factorize(series)
+    # code -1 (a missing value) picks the trailing NaN
+    results = np.array([function(value) for value in values] + [np.nan], dtype=object)
+    return pd.Series(results[codes], index=series.index, dtype=series.dtype)
+
 def clean_name_column(df):
     """Keep only the first name in the Name column"""
     print("Step 2: Cleaning name column...")
     
     if "Name" in df.columns:
-        df["Name"] = df["Name"].apply(lambda x: x.split()[0] if pd.notna(x) else x)
+        df["Name"] = map_distinct(df["Name"], lambda x: x.split()[0] if x.strip() else x)
     
     print("Name column cleaned!")
     return df
 
-def clean_age_data(df):
-    """Clean the age column by converting to numeric values"""
+def clean_age_data(df, median_age=None):
+    """Clean the age column by converting to numeric values.
+
+    Missing ages get median_age, or the median of this frame when it is None.
+    """
     print("Step 3: Cleaning age data...")
     
     # Make a copy of the original age column
@@ -38,7 +59,8 @@ def clean_age_data(df):
     df["Age"] = pd.to_numeric(df["Age"], errors='coerce')
     
     # Fill NaN ages with the median age
-    median_age = df["Age"].median()
+    if median_age is None:
+        median_age = df["Age"].median()
     df["Age"] = df["Age"].fillna(median_age)
     
     # Convert to integer
@@ -47,91 +69,130 @@ def clean_age_data(df):
     print("Age data cleaned!")
     return df
 
-def clean_genre_preferences(df):
-    """Clean the genre preference columns"""
+# Define a mapping to convert text ratings to numeric
+GENRE_RATING_MAP = {
+    'Love': 5,
+    'Like': 4,
+    'Neutral': 3,
+    'Dislike': 2,
+    'Hate': 1
+}
+
+def genre_rating(answer):
+    """Convert one genre answer to its numeric rating, or NaN if it has none"""
+    text = str(answer)
+    # 'Like' is part of 'Dislike', so it only counts when 'Dislike' is absent
+    if 'Love' in text:
+        return GENRE_RATING_MAP['Love']
+    if 'Like' in text and 'Dislike' not in text:
+        return GENRE_RATING_MAP['Like']
+    for label in ('Neutral', 'Dislike', 'Hate'):
+        if label in text:
+            return GENRE_RATING_MAP[label]
+    return np.nan
+
+def clean_genre_preferences(df, complete_columns=None):
+    """Clean the genre preference columns.
+
+    complete_columns names the rating columns to store as integers; by
+    default those without a missing rating in this frame.
+    """
     print("Step 4: Cleaning genre preferences...")
     
     # Columns that contain genre preferences
     genre_columns = [col for col in df.columns if col.startswith('Genre_')]
     
-    # Define a mapping to convert text ratings to numeric
-    rating_map = {
-        'Love': 5,
-        'Like': 4,
-        'Neutral': 3,
-        'Dislike': 2,
-        'Hate': 1
-    }
-    
-    # Process each genre column
-    for col in genre_columns:
-        # Extract genre name from the column
-        genre_name = col.replace('Genre_', '')
-        new_col_name = f"Genre_Rating_{genre_name}"
-        
-        # Process the values
-        df[new_col_name] = df[col].apply(lambda x: 
-            5 if 'Love' in str(x) else
-            4 if 'Like' in str(x) and 'Dislike' not in str(x) else
-            3 if 'Neutral' in str(x) else
-            2 if 'Dislike' in str(x) else
-            1 if 'Hate' in str(x) else
-            np.nan
-        )
+    new_columns = [f"Genre_Rating_{col.replace('Genre_', '')}" for col in genre_columns]
+
+    # Score each distinct answer once, then look the scores up for every cell of every genre column
+    answers = df[genre_columns].to_numpy().ravel()
+    codes, distinct_answers = pd.factorize(answers)
+    # code -1 (a missing answer) picks the trailing NaN
+    scores = np.array([genre_rating(answer) for answer in distinct_answers] + [np.nan])
+    ratings = pd.DataFrame(scores[codes].reshape(len(df), len(genre_columns)), columns=new_columns, index=df.index)
+
+    # Columns without missing answers stay whole numbers
+    if complete_columns is None:
+        complete_columns = ratings.columns[ratings.notna().all()]
+    df[new_columns] = ratings.astype({col: "int64" for col in complete_columns})
     
     print("Genre preferences cleaned!")
     return df
 
-def clean_movie_ratings(df):
-    """Clean the movie rating columns"""
+def column_medians(values):
+    """Median of every column of a 2D float array, skipping NaN; NaN for a column with no values"""
+    if not len(values):
+        return np.full(values.shape[1], np.nan)
+    # np.sort puts NaN last, so each column's values are its first `counts` rows
+    ordered = np.sort(values, axis=0)
+    counts = (~np.isnan(values)).sum(axis=0)
+    present = np.maximum(counts, 1)
+    columns = np.arange(values.shape[1])
+    medians = (ordered[(present - 1) // 2, columns] + ordered[present // 2, columns]) / 2
+    return np.where(counts > 0, medians, np.nan)
+
+def clean_movie_ratings(df, medians=None):
+    """Clean the movie rating columns.
+
+    medians maps each Movie_Rating_ column to its fill value; by default the
+    medians of this frame are used.
+    """
     print("Step 5: Cleaning movie ratings...")
     
     # Columns that contain movie ratings
     movie_columns = [col for col in df.columns if col.startswith('Rating_')]
     
-    # Process each movie column
-    for col in movie_columns:
-        # Extract movie name from the column
-        movie_name = col.replace('Rating_', '')
-        new_col_name = f"Movie_Rating_{movie_name}"
-        
-        # Convert ratings to numeric
-        df[new_col_name] = pd.to_numeric(df[col], errors='coerce')
-        
-        # Fill missing values with the median rating for that movie
-        median_rating = df[new_col_name].median()
-        df[new_col_name] = df[new_col_name].fillna(median_rating)
+    new_columns = [f"Movie_Rating_{col.replace('Rating_', '')}" for col in movie_columns]
+
+    # Convert ratings to numeric; only columns read as text need parsing
+    ratings = df[movie_columns]
+    text_columns = [col for col in movie_columns if not pd.api.types.is_numeric_dtype(ratings[col])]
+    if text_columns:
+        ratings = ratings.assign(**{col: pd.to_numeric(ratings[col], errors='coerce') for col in text_columns})
+    integer_columns = [new for col, new in zip(movie_columns, new_columns)
+                       if pd.api.types.is_integer_dtype(ratings[col])]
+    values = ratings.to_numpy(dtype=float)
+
+    # Fill missing values with the median rating for that movie, all movies at once
+    if medians is None:
+        fills = column_medians(values)
+    else:
+        fills = np.array([medians[col] for col in new_columns], dtype=float)
+    np.copyto(values, fills, where=np.isnan(values))
+    filled = pd.DataFrame(values, columns=new_columns, index=df.index)
+    # whole number columns have nothing to fill and stay whole numbers
+    df[new_columns] = filled.astype({col: "int64" for col in integer_columns})
     
     print("Movie ratings cleaned!")
     return df
 
+# Columns that likely contain text responses (excluding some that we've already processed)
+TEXT_COLUMNS = [
+    "What's your name?",
+    "What is your favourite movie genre?",
+    " What is the title of the last movie you watched?  ",
+    " Who was your favourite character in the movie?  ",
+    " What did you like most about the movie?  ",
+    " What did you dislike about the movie?  "
+]
+
 def clean_text_responses(df):
     """Clean text response columns by removing extra spaces and standardizing case"""
     print("Step 6: Cleaning text responses...")
     
-    # Columns that likely contain text responses (excluding some that we've already processed)
-    text_columns = [
-        "What's your name?",
-        "What is your favourite movie genre?",
-        " What is the title of the last movie you watched?  ",
-        " Who was your favourite character in the movie?  ",
-        " What did you like most about the movie?  ",
-        " What did you dislike about the movie?  "
-    ]
-    
     # Process each text column
-    for col in text_columns:
+    for col in TEXT_COLUMNS:
         if col in df.columns:
             # Strip whitespace and convert to title case
-            df[col] = df[col].astype(str).apply(lambda x: x.strip().title() if pd.notna(x) and x.strip() != "" else "Not Provided")
+            df[col] = map_distinct(df[col].astype(str), lambda x: x.strip().title() or "Not Provided").fillna("Not Provided")
     
     print("Text responses cleaned!")
     return df
 
-def save_cleaned_data(df, output_file):
-    """Save the cleaned data to a new CSV file"""
+def save_cleaned_data(df, output_file, append=False):
+    """Save the cleaned data to a new CSV file, or add its rows to the end of one"""
     print(f"Step 7: Saving cleaned data to {output_file}...")
-    df.to_csv(output_file, index=False)
+    df.to_csv(output_file, index=False, mode="a" if append else "w", header=not append)
     print(f"Data successfully saved to {output_file}!")
 
 def rename_columns(df):
@@ -176,7 +237,7 @@ def rename_columns(df):
     print("Columns renamed!")
     return df
 
-def create_genre_preference_matrix(df, output_file):
+def create_genre_preference_matrix(df, output_file, append=False):
     """Create and save a matrix of user genre preferences"""
     print(f"\nStep 8: Creating genre preference matrix...")
     
@@ -194,11 +255,11 @@ def create_genre_preference_matrix(df, output_file):
     genre_matrix.set_index('Name', inplace=True)
     
     # Save to CSV
-    genre_matrix.to_csv(output_file)
+    genre_matrix.to_csv(output_file, mode="a" if append else "w", header=not append)
     print(f"Genre preference matrix saved to {output_file}!")
     return genre_matrix
 
-def create_movie_rating_matrix(df, output_file):
+def create_movie_rating_matrix(df, output_file, append=False):
     """Create and save a matrix of user movie ratings"""
     print(f"\nStep 9: Creating movie rating matrix...")
     
@@ -216,12 +277,138 @@ def create_movie_rating_matrix(df, output_file):
     movie_matrix.set_index('Name', inplace=True)
     
     # Save to CSV
-    movie_matrix.to_csv(output_file)
+    movie_matrix.to_csv(output_file, mode="a" if append else "w", header=not append)
     print(f"Movie rating matrix saved to {output_file}!")
     return movie_matrix
 
+def rating_matrix_from(df):
+    """Sparse ratings of each user (by Name) for each movie, leaving out the ratings that are missing"""
+    movie_columns = [col for col in df.columns if col.startswith('Movie_Rating_')]
+    ratings = df[['Name'] + movie_columns].rename(columns={col: col.replace('Movie_Rating_', '') for col in movie_columns})
+    return RatingMatrix.from_wide(ratings, id_column='Name')
+
+def create_sparse_rating_matrix(df, output_file):
+    """Create and save the movie ratings as a sparse matrix that the training scripts load directly"""
+    print(f"\nStep 10: Creating sparse movie rating matrix...")
+
+    matrix = rating_matrix_from(df)
+    matrix.save(output_file)
+    print(f"Sparse rating matrix with {len(matrix)} ratings ({matrix.shape[0]} users x {matrix.shape[1]} movies) saved to {output_file}!")
+    return matrix
+
+def median_from_counts(counts):
+    """Exact median of the values in a {value: count} dict, NaN if it is empty"""
+    total = sum(counts.values())
+    if total == 0:
+        return np.nan
+    values = sorted(counts)
+    cumulative = np.cumsum([counts[value] for value in values])
+    # the value at sorted position k is the first one whose running count passes k
+    lower = values[np.searchsorted(cumulative, (total - 1) // 2, side="right")]
+    upper = values[np.searchsorted(cumulative, total // 2, side="right")]
+    return (lower + upper) / 2
+
+def common_dtype(first, second):
+    """The dtype pandas would give a column whose chunks were read as first and second"""
+    if first is None or first == second:
+        return second
+    if pd.api.types.is_numeric_dtype(first) and pd.api.types.is_numeric_dtype(second):
+        return np.dtype("float64")
+    return str
+
+def scan_form(input_file, chunksize=CHUNK_SIZE):
+    """First pass of streaming mode: everything the cleaning steps need from the whole file.
+
+    Returns the cleaned column names, the dtype of every raw column as a
+    single read would infer it, the median age, the median of every movie
+    rating column and the genre rating columns without a missing rating.
+    The medians are exact: they come from value counts, which stay small
+    because ages and ratings take few distinct values.
+    """
+    print(f"Scanning {input_file}...")
+    raw_columns = pd.read_csv(input_file, nrows=0).columns
+    columns = rename_columns(pd.DataFrame(columns=raw_columns)).columns
+
+    dtypes = {}
+    age_counts = Counter()
+    rating_counts = defaultdict(Counter)
+    incomplete_genres = set()
+    rows = 0
+    for chunk in pd.read_csv(input_file, chunksize=chunksize):
+        for col, dtype in chunk.dtypes.items():
+            dtypes[col] = common_dtype(dtypes.get(col), dtype)
+        chunk.columns = columns
+        rows += len(chunk)
+
+        if "Age" in chunk.columns:
+            age_counts.update(pd.to_numeric(chunk["Age"], errors='coerce').dropna().tolist())
+        for col in chunk.columns:
+            if col.startswith('Rating_'):
+                rating_counts[col].update(pd.to_numeric(chunk[col], errors='coerce').dropna().tolist())
+            elif col.startswith('Genre_'):
+                answers = chunk[col].unique()
+                if any(pd.isna(genre_rating(answer)) for answer in answers):
+                    incomplete_genres.add(col)
+
+    print(f"Scanned {rows} rows!")
+    return {
+        "columns": columns,
+        "dtypes": dtypes,
+        "median_age": median_from_counts(age_counts),
+        "movie_medians": {col.replace('Rating_', 'Movie_Rating_', 1): median_from_counts(rating_counts[col])
+                          for col in columns if col.startswith('Rating_')},
+        "complete_genres": [col.replace('Genre_', 'Genre_Rating_', 1)
+                            for col in columns if col.startswith('Genre_') and col not in incomplete_genres],
+    }
+
+def clean_chunks(input_file, output_file, genre_matrix_file, movie_matrix_file, sparse_matrix_file,
+                 chunksize=CHUNK_SIZE):
+    """Clean the export chunk by chunk, appending to the outputs, so memory does not grow with the file.
+
+    A first pass (scan_form) collects the medians and column types, so the
+    outputs are the same as cleaning the whole file at once. The sparse
+    ratings go to temporary files as each chunk finishes; only the user
+    names stay in memory until the .npz is written.
+    """
+    stats = scan_form(input_file, chunksize)
+
+    with tempfile.TemporaryDirectory() as folder:
+        sparse_writer = RatingMatrixWriter(sparse_matrix_file, folder)
+        clean_chunk_files(input_file, output_file, genre_matrix_file, movie_matrix_file, sparse_writer, stats,
+                          chunksize)
+        sparse_writer.close()
+    print(f"Saved {output_file}, {genre_matrix_file}, {movie_matrix_file} and {sparse_matrix_file}!")
+
+def clean_chunk_files(input_file, output_file, genre_matrix_file, movie_matrix_file, sparse_writer, stats,
+                      chunksize):
+    """Second pass of streaming mode: clean every chunk and append it to the outputs"""
+    rows = 0
+    for number, chunk in enumerate(pd.read_csv(input_file, chunksize=chunksize, dtype=stats["dtypes"])):
+        append = number > 0
+        # the per-step messages would repeat for every chunk
+        with contextlib.redirect_stdout(io.StringIO()):
+            chunk.columns = stats["columns"]
+            chunk = clean_name_column(chunk)
+            chunk = clean_age_data(chunk, stats["median_age"])
+            chunk = clean_genre_preferences(chunk, stats["complete_genres"])
+            chunk = clean_movie_ratings(chunk, stats["movie_medians"])
+            chunk = clean_text_responses(chunk)
+
+            save_cleaned_data(chunk, output_file, append)
+            create_genre_preference_matrix(chunk, genre_matrix_file, append)
+            create_movie_rating_matrix(chunk, movie_matrix_file, append)
+            sparse_writer.add(rating_matrix_from(chunk))
+        rows += len(chunk)
+        print(f"Cleaned {rows} rows...")
+
 def main():
     """Main function to run the data cleaning process"""
+    parser = argparse.ArgumentParser(description="Clean the movie preferences form export")
+    parser.add_argument("--chunksize", type=int, nargs="?", const=CHUNK_SIZE,
+                        help=f"stream the export this many rows at a time (default {CHUNK_SIZE}) "
+                             "instead of loading it all at once")
+    args = parser.parse_args()
+
     print("=== Movie Preferences Data Cleaning ===")
     
     # Define file paths
@@ -229,6 +416,13 @@ def main():
     output_file = "cleaned_movie_preferences.csv"
     genre_matrix_file = "genre_preference_matrix.csv"
     movie_matrix_file = "movie_rating_matrix.csv"
+    sparse_matrix_file = RATING_MATRIX_FILE
+
+    if args.chunksize:
+        clean_chunks(input_file, output_file, genre_matrix_file, movie_matrix_file, sparse_matrix_file,
+                     args.chunksize)
+        print("\nThe clean data is now ready for analysis!")
+        return
     
     # Load data
     df = load_data(input_file)
@@ -253,6 +447,7 @@ def main():
     # Create and save matrices
     create_genre_preference_matrix(df, genre_matrix_file)
     create_movie_rating_matrix(df, movie_matrix_file)
+    create_sparse_rating_matrix(df, sparse_matrix_file)
     
     print("\nData cleaning complete! Here's what we did:")
     print("1. Fixed age values by converting to numbers")
@@ -261,6 +456,7 @@ def main():
     print("4. Standardized text responses by fixing spaces and capitalization")
     print("5. Created a genre preference matrix")
     print("6. Created a movie rating matrix")
+    print("7. Saved the movie ratings as a sparse matrix for training")
     print("\nThe clean data is now ready for analysis!")
 
 # Run the script
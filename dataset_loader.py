@@ -0,0 +1,115 @@
+import csv
+import os
+import time
+import tracemalloc
+
+import pandas as pd
+
+DATASET_FOLDER = "ml-from-2015"
+
+USER_COLUMNS = ["userID", "age", "gender", "username", "discordID"]
+# The 19 genre flag columns at the end of every u.item row, in file order
+GENRE_NAMES = ["unknown", "Action", "Adventure", "Animation", "Children's", "Comedy", "Crime", "Documentary", "Drama",
+               "Fantasy", "Film-Noir", "Horror", "Musical", "Mystery", "Romance", "Sci-Fi", "Thriller", "War", "Western"]
+
+# Per-file load time and peak memory, filled in by measure_load
+LOAD_STATS = {}
+# Also trace peak memory in measure_load; tracing every allocation slows loads down, so it is off unless asked for
+TRACE_LOAD_MEMORY = os.getenv("TRACE_LOAD_MEMORY", "") not in ("", "0")
+
+
+def measure_load(label, loader, *args, **kwargs):
+    """Run loader, then record and print its wall time and, with TRACE_LOAD_MEMORY, its peak traced memory"""
+    tracing = TRACE_LOAD_MEMORY
+    was_tracing = tracemalloc.is_tracing()
+    if tracing:
+        if not was_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+
+    start = time.perf_counter()
+    result = loader(*args, **kwargs)
+    seconds = time.perf_counter() - start
+
+    peak_bytes = None
+    if tracing:
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        if not was_tracing:
+            tracemalloc.stop()
+
+    LOAD_STATS[label] = {"seconds": seconds, "peak_bytes": peak_bytes}
+    memory = "" if peak_bytes is None else f" (peak memory {peak_bytes / 2 ** 20:.1f} MiB)"
+    print(f"Loaded {label} in {seconds * 1000:.1f} ms{memory}")
+    return result
+
+
+def read_users(file_path):
+    """Read u.user, keeping only the columns the bot needs"""
+    # discordID shares its column with MovieLens zip codes, so it is read as text
+    return pd.read_csv(file_path,
+                       sep="|",
+                       names=USER_COLUMNS,
+                       usecols=["userID", "gender", "discordID"],
+                       dtype={"userID": "int32", "gender": "category", "discordID": str})
+
+
+def read_movies(file_path):
+    """Read the movie id and title columns of u.item"""
+    return pd.read_csv(file_path,
+                       sep="|",
+                       usecols=[0, 1],
+                       names=["movieID", "title"],
+                       dtype={"movieID": "int32", "title": str},
+                       encoding='ISO-8859-1')
+
+
+def read_movie_genres(file_path):
+    """Read the movie id and the 19 genre flags of u.item.
+
+    A few titles contain the "|" separator themselves, so each line is split
+    from the right to find the flags instead of by column position.
+    """
+    lines = pd.read_csv(file_path, sep="\t", header=None, names=["line"], dtype=str, quoting=csv.QUOTE_NONE,
+                        encoding='ISO-8859-1')["line"]
+    fields = lines.str.rsplit("|", n=len(GENRE_NAMES), expand=True)
+    genres = fields.iloc[:, 1:].astype("int8")
+    genres.columns = GENRE_NAMES
+    genres.insert(0, "movieID", fields[0].str.split("|", n=1).str[0].astype("int32"))
+    return genres
+
+
+def read_movies_csv(file_path):
+    """Read the movieId and title columns of movies.csv"""
+    return pd.read_csv(file_path,
+                       usecols=["movieId", "title"],
+                       dtype={"movieId": "int32", "title": str})
+
+
+def discord_user_mapping(df_users):
+    """Map discord id to dataset user id for every gender == "D" row"""
+    discord_users = df_users[df_users["gender"] == "D"]
+    discord_ids = discord_users["discordID"].astype("int64").tolist()
+    return dict(zip(discord_ids, discord_users["userID"].tolist()))
+
+
+def next_user_id(df_users):
+    """The first user id that is not taken in u.user"""
+    if df_users.empty:
+        return 1
+    return int(df_users["userID"].max()) + 1
+
+
+def movie_title_mapping(df_movies, id_column="movieID"):
+    """Map movie id to title"""
+    return dict(zip(df_movies[id_column].tolist(), df_movies["title"].tolist()))
+
+
+def main():
+    """Load every dataset file once and print the load report"""
+    measure_load("u.user", read_users, f"{DATASET_FOLDER}/u.user")
+    measure_load("u.item", read_movies, f"{DATASET_FOLDER}/u.item")
+    measure_load("movies.csv", read_movies_csv, f"{DATASET_FOLDER}/movies.csv")
+
+
+if __name__ == "__main__":
+    main()
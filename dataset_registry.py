@@ -0,0 +1,85 @@
+import threading
+import traceback
+
+
+class DatasetRegistry:
+    """Named datasets that load on first use instead of at import time.
+
+    Each dataset is registered with a loader function. get() runs the loader
+    the first time the dataset is needed and returns its cached result after
+    that; warm() does the same for every dataset in a background thread so
+    the bot can answer other commands while the data is still loading. A
+    dataset whose loader raised is reported as failed and left alone by
+    warm(); only an explicit get() tries it again.
+    """
+
+    def __init__(self):
+        self.loaders = {}
+        self.results = {}
+        self.errors = {}
+        self.locks = {}
+        self.warm_lock = threading.Lock()
+        self.warm_thread = None
+
+    def register(self, name, loader):
+        self.loaders[name] = loader
+        self.locks[name] = threading.Lock()
+
+    def is_loaded(self, name):
+        return name in self.results
+
+    def failed(self, *names):
+        """The named datasets (or registered ones) whose last load raised"""
+        return [name for name in names or self.loaders if name in self.errors and name not in self.results]
+
+    def ready(self, *names):
+        """True when every named dataset (or every registered one) has loaded"""
+        return all(self.is_loaded(name) for name in names or self.loaders)
+
+    def get(self, name):
+        """Return the dataset, loading it in the calling thread if needed"""
+        if name in self.results:
+            return self.results[name]
+
+        with self.locks[name]:
+            # another thread may have finished loading while we waited
+            if name not in self.results:
+                try:
+                    self.results[name] = self.loaders[name]()
+                except Exception as error:
+                    self.errors[name] = error
+                    raise
+                self.errors.pop(name, None)
+        return self.results[name]
+
+    def warm(self, names=None):
+        """Load the datasets in a daemon thread, unless a warm-up is already running"""
+        with self.warm_lock:
+            if self.warm_thread is not None and self.warm_thread.is_alive():
+                return self.warm_thread
+            self.warm_thread = threading.Thread(target=self._warm, args=(names or list(self.loaders),),
+                                                name="dataset-warmup", daemon=True)
+            self.warm_thread.start()
+            return self.warm_thread
+
+    def _warm(self, names):
+        for name in names:
+            if name in self.errors:
+                continue
+            try:
+                self.get(name)
+            except Exception:
+                print(f"Failed to load dataset {name}:")
+                traceback.print_exc()
+
+    def status(self):
+        """Map each dataset name to "ready", "failed" or "loading" """
+        states = {}
+        for name in self.loaders:
+            if name in self.results:
+                states[name] = "ready"
+            elif name in self.errors:
+                states[name] = "failed"
+            else:
+                states[name] = "loading"
+        return states
@@ -0,0 +1,255 @@
+import re
+import zlib
+from array import array
+from bisect import bisect_left
+
+import numpy as np
+
+from snapshot import encode_text
+from title_index import normalize_title
+
+# Most edits (insert, delete, substitute, swap neighbours) allowed between a query word and a title word
+MAX_EDIT_DISTANCE = 2
+# Only this many leading characters of a word are used for the deletion variants, which bounds their number
+PREFIX_LENGTH = 7
+# Most titles ranked per query; the shortest candidates are kept, so very common words stay fast
+MAX_CANDIDATES = 2000
+# Distance given to a title that lacks a query word, larger than any real one
+MISSING = 127
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def title_words(text):
+    """Words of a normalized title, without punctuation"""
+    return WORD_PATTERN.findall(text)
+
+
+def indexed_words(text):
+    """Words of a normalized title plus each pair of neighbours written together ("spider man" -> "spiderman")"""
+    words = title_words(text)
+    return set(words) | {first + second for first, second in zip(words, words[1:])}
+
+
+def edit_budget(word):
+    """Edits tolerated for a word: none for short words, where a single edit gives another real word"""
+    if len(word) <= 3:
+        return 0
+    if len(word) <= 6:
+        return 1
+    return MAX_EDIT_DISTANCE
+
+
+def deletes(word, distance):
+    """word and every string made by deleting up to `distance` characters from it"""
+    variants = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {text[:i] + text[i + 1:] for text in frontier for i in range(len(text))}
+        variants |= frontier
+    return variants
+
+
+def stable_hash(text):
+    """CRC32 of a string; unlike hash() it is the same in every process, so it can be stored"""
+    return zlib.crc32(text.encode("utf-8"))
+
+
+def edit_distance(first, second, max_distance):
+    """Damerau-Levenshtein (optimal string alignment) distance, or max_distance + 1 once it is exceeded"""
+    if abs(len(first) - len(second)) > max_distance:
+        return max_distance + 1
+    previous2 = None
+    previous = list(range(len(second) + 1))
+    for i in range(1, len(first) + 1):
+        current = [i] + [0] * len(second)
+        for j in range(1, len(second) + 1):
+            cost = first[i - 1] != second[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous2 is not None and i > 1 and j > 1 and first[i - 1] == second[j - 2]
+                    and first[i - 2] == second[j - 1]):
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def indptr_from(counts):
+    """CSR row pointers for rows of the given lengths"""
+    indptr = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    return indptr
+
+
+class FuzzyIndex:
+    """Typo tolerant title lookup for "did you mean" suggestions.
+
+    Works per word, SymSpell style: every title word is stored under each
+    string made by deleting up to MAX_EDIT_DISTANCE characters from its
+    prefix, so the spellings near a query word are found by generating the
+    query word's own deletions and looking them up, then checking the few
+    hits with a real edit distance. Titles are ranked by how many query
+    words they contain (allowing typos), then by total edits, then by
+    length.
+
+    Everything lives in flat arrays so one built index can be saved or
+    memory mapped by several processes. Words are numbered in the order of
+    their stable_hash, which word_hashes holds, so a word is found by
+    binary search. Deletion variants are kept only as hashes too; two
+    variants sharing a hash just add candidates that the edit distance
+    check then turns away. Each title's words, each word's titles and each
+    variant's words are CSR lists (an indptr array into a values array).
+    """
+
+    def __init__(self, keys, lengths, title_indptr, title_words, word_buffer, word_offsets, word_hashes,
+                 posting_indptr, posting_positions, variant_hashes, variant_indptr, variant_words, settings):
+        """Wrap arrays already laid out by build(), such as memory mapped ones; nothing is copied"""
+        self.keys = keys
+        self.lengths = lengths
+        self.title_indptr = title_indptr
+        self.title_words = title_words
+        self.word_buffer = word_buffer
+        self.word_offsets = word_offsets
+        self.word_hashes = word_hashes
+        self.posting_indptr = posting_indptr
+        self.posting_positions = posting_positions
+        self.variant_hashes = variant_hashes
+        self.variant_indptr = variant_indptr
+        self.variant_words = variant_words
+        self.settings = settings
+        self.max_distance, self.prefix_length = (int(value) for value in settings)
+        self.hash_view = memoryview(word_hashes)
+        self.offset_view = memoryview(word_offsets)
+        self.text_view = memoryview(word_buffer)
+
+    @classmethod
+    def build(cls, titles, max_distance=MAX_EDIT_DISTANCE, prefix_length=PREFIX_LENGTH):
+        """Index a {movie id: title} mapping"""
+        # shortest titles first, so position also breaks ties in favour of shorter titles
+        entries = sorted(((title_words(normalize_title(title)), key) for key, title in titles.items()),
+                         key=lambda entry: sum(map(len, entry[0])))
+        word_sets = [indexed_words(" ".join(words)) for words, key in entries]
+        vocabulary = sorted({word for words in word_sets for word in words}, key=lambda word: (stable_hash(word), word))
+        word_ids = {word: number for number, word in enumerate(vocabulary)}
+
+        per_title = [sorted(word_ids[word] for word in words) for words in word_sets]
+        title_indptr = indptr_from([len(words) for words in per_title])
+        title_word_ids = np.fromiter((number for words in per_title for number in words), dtype=np.int32,
+                                     count=int(title_indptr[-1]))
+        # the same pairs sorted by word give every word's titles, in position order
+        positions = np.repeat(np.arange(len(per_title), dtype=np.int32), np.diff(title_indptr))
+        posting_indptr = indptr_from(np.bincount(title_word_ids, minlength=len(vocabulary)))
+        posting_positions = positions[np.argsort(title_word_ids, kind="stable")]
+
+        # a word is only stored under as many deletions as it tolerates edits; short words match exactly
+        variant_keys, variant_word_ids = array("I"), array("i")
+        for number, word in enumerate(vocabulary):
+            budget = min(edit_budget(word), max_distance)
+            if budget == 0:
+                continue
+            for variant in deletes(word[:prefix_length], budget):
+                variant_keys.append(stable_hash(variant))
+                variant_word_ids.append(number)
+        pairs = np.unique(np.frombuffer(variant_keys, dtype=np.uint32).astype(np.uint64) << 32
+                          | np.frombuffer(variant_word_ids, dtype=np.int32).astype(np.uint64))
+        variant_hashes, counts = np.unique((pairs >> 32).astype(np.uint32), return_counts=True)
+        variant_indptr = indptr_from(counts)
+        variant_words = (pairs & 0xFFFFFFFF).astype(np.int32)
+
+        word_buffer, word_offsets = encode_text(vocabulary)
+        word_hashes = np.fromiter(map(stable_hash, vocabulary), dtype=np.uint32, count=len(vocabulary))
+        return cls(np.array([key for words, key in entries], dtype=np.int64),
+                   np.array([len(words) for words, key in entries], dtype=np.int32),
+                   title_indptr, title_word_ids, word_buffer, word_offsets, word_hashes,
+                   posting_indptr, posting_positions, variant_hashes, variant_indptr, variant_words,
+                   np.array([max_distance, prefix_length], dtype=np.int32))
+
+    def arrays(self):
+        """The arrays behind the index by constructor argument name, to save or share"""
+        names = ["keys", "lengths", "title_indptr", "title_words", "word_buffer", "word_offsets", "word_hashes",
+                 "posting_indptr", "posting_positions", "variant_hashes", "variant_indptr", "variant_words",
+                 "settings"]
+        return {name: getattr(self, name) for name in names}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def word(self, number):
+        return str(self.text_view[self.offset_view[number]:self.offset_view[number + 1]], "utf-8")
+
+    def word_number(self, word):
+        """Number of an indexed word, or -1"""
+        key = stable_hash(word)
+        number = bisect_left(self.hash_view, key)
+        while number < len(self.hash_view) and self.hash_view[number] == key:
+            if self.word(number) == word:
+                return number
+            number += 1
+        return -1
+
+    def word_candidates(self, word):
+        """{word number: edit distance} for the title words within the edit budget of both words"""
+        budget = min(edit_budget(word), self.max_distance)
+        exact = self.word_number(word)
+        found = {exact: 0} if exact >= 0 else {}
+        if budget == 0:
+            return found
+
+        keys = np.fromiter(map(stable_hash, deletes(word[:self.prefix_length], budget)), dtype=np.uint32)
+        rows = np.minimum(np.searchsorted(self.variant_hashes, keys), len(self.variant_hashes) - 1)
+        rows = rows[self.variant_hashes[rows] == keys] if len(self.variant_hashes) else rows[:0]
+        numbers = set()
+        for row in rows.tolist():
+            numbers.update(self.variant_words[self.variant_indptr[row]:self.variant_indptr[row + 1]].tolist())
+        for number in numbers:
+            if number in found:
+                continue
+            candidate = self.word(number)
+            allowed = min(budget, edit_budget(candidate))
+            distance = edit_distance(word, candidate, allowed)
+            if distance <= allowed:
+                found[number] = distance
+        return found
+
+    def postings(self, number):
+        return self.posting_positions[self.posting_indptr[number]:self.posting_indptr[number + 1]]
+
+    def suggest(self, query, limit=5):
+        """Movie ids of up to `limit` titles closest to query, best first"""
+        tokens = title_words(normalize_title(query))
+        candidates = [self.word_candidates(token) for token in tokens]
+        matched = [found for found in candidates if found]
+        if not matched:
+            return []
+
+        # only titles containing the rarest matched word are ranked, which keeps common words cheap
+        def frequency(found):
+            return sum(int(self.posting_indptr[number + 1] - self.posting_indptr[number]) for number in found)
+
+        rarest = min(matched, key=frequency)
+        positions = np.unique(np.concatenate([self.postings(number) for number in rarest]))[:MAX_CANDIDATES]
+
+        # the words of every candidate title, one after the other; segments marks where each title's begin
+        starts = self.title_indptr[positions]
+        counts = self.title_indptr[positions + 1] - starts
+        segments = np.cumsum(counts) - counts
+        words = self.title_words[np.repeat(starts - segments, counts) + np.arange(counts.sum())]
+
+        missing = np.zeros(len(positions), dtype=np.int64)
+        distance = np.zeros(len(positions), dtype=np.int64)
+        distances = np.full(len(self.word_hashes), MISSING, dtype=np.int8)
+        for found in candidates:
+            numbers = np.fromiter(found, dtype=np.int64, count=len(found))
+            distances[numbers] = np.fromiter(found.values(), dtype=np.int8, count=len(found))
+            # the closest spelling of this query word in each title
+            best = np.minimum.reduceat(distances[words], segments)
+            distances[numbers] = MISSING
+            missing += best == MISSING
+            distance += np.where(best == MISSING, 0, best)
+
+        # at least half of the query words have to be there
+        keep = missing * 2 <= len(tokens)
+        positions, missing, distance = positions[keep], missing[keep], distance[keep]
+        order = np.lexsort((positions, self.lengths[positions], distance, missing))[:limit]
+        return self.keys[positions[order]].tolist()
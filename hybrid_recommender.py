@@ -0,0 +1,162 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from dataset_loader import DATASET_FOLDER, GENRE_NAMES, read_movie_genres
+from metrics import LatencyTracker
+from scoring import top_n
+
+# Per-user genre scores from the survey, written by clean_data.py
+GENRE_PREFERENCES_FILE = "genre_preference_matrix.csv"
+# Genre scores run from 1 (hate) to 5 (love); 3 is neutral and moves no movie up or down
+MIN_GENRE_SCORE = 1
+MAX_GENRE_SCORE = 5
+NEUTRAL_GENRE_SCORE = 3
+# Neutral ratings assumed per genre when a genre vector is estimated from a user's ratings
+GENRE_PRIOR_RATINGS = 2
+# Users with fewer ratings than this get content scores only
+MIN_COLLABORATIVE_RATINGS = 5
+# Ratings at which collaborative and content scores weigh the same; more ratings favour the SVD
+BLEND_SHRINKAGE = 10
+
+
+def read_genre_preferences(file_path=GENRE_PREFERENCES_FILE):
+    """The survey genre preference matrix: one row per respondent, one 1-5 column per genre"""
+    return pd.read_csv(file_path, index_col="Name")
+
+
+class ContentScorer:
+    """Scores every movie for a genre preference vector.
+
+    Each movie's row of the item-genre matrix spreads one unit over its
+    genres, so a movie's score is the average of the user's centred genre
+    scores over its genres, put back on the 1-5 rating scale. Scoring all
+    movies is one matrix-vector product.
+    """
+
+    def __init__(self, item_ids, genre_flags, default_preferences=None):
+        self.item_ids = np.asarray(item_ids)
+        self.item_index = {item: row for row, item in enumerate(self.item_ids.tolist())}
+        self.genre_flags = np.asarray(genre_flags, dtype=np.float32)
+        counts = self.genre_flags.sum(axis=1, keepdims=True)
+        self.item_genres = np.divide(self.genre_flags, counts, out=np.zeros_like(self.genre_flags), where=counts > 0)
+        self.genre_index = {genre.lower(): column for column, genre in enumerate(GENRE_NAMES)}
+        self.default_vector = self.genre_vector(default_preferences or {})
+
+    def genre_vector(self, preferences):
+        """Centred vector over GENRE_NAMES from {genre name: 1-5 score}; unknown genres are ignored"""
+        vector = np.zeros(len(GENRE_NAMES), dtype=np.float32)
+        for genre, score in preferences.items():
+            column = self.genre_index.get(str(genre).lower())
+            if column is not None:
+                vector[column] = float(np.clip(score, MIN_GENRE_SCORE, MAX_GENRE_SCORE)) - NEUTRAL_GENRE_SCORE
+        return vector
+
+    def vector_from_ratings(self, ratings):
+        """Centred genre vector from {movie id: rating}, each genre's mean rating shrunk towards neutral"""
+        rated = [(self.item_index[movie], rating) for movie, rating in ratings.items() if movie in self.item_index]
+        if not rated:
+            return self.default_vector
+        rows = np.array([row for row, rating in rated])
+        values = np.array([rating for row, rating in rated], dtype=np.float32) - NEUTRAL_GENRE_SCORE
+        flags = self.genre_flags[rows]
+        return (flags.T @ values) / (flags.sum(axis=0) + GENRE_PRIOR_RATINGS)
+
+    def scores(self, vector):
+        """Predicted 1-5 rating of every movie in item_ids"""
+        return NEUTRAL_GENRE_SCORE + self.item_genres @ vector
+
+
+class HybridRecommender:
+    """Content scores for cold-start users, blended with the SVD model otherwise.
+
+    A user with fewer than min_ratings ratings, or one the model does not
+    know, is ranked by ContentScorer alone. Otherwise each movie gets
+    w * collaborative + (1 - w) * content with w = n / (n + shrinkage), so
+    the SVD takes over as a user's ratings grow. Latency is tracked
+    separately for content-only and blended requests.
+    """
+
+    def __init__(self, model_service, scorer, min_ratings=MIN_COLLABORATIVE_RATINGS, shrinkage=BLEND_SHRINKAGE):
+        self.model_service = model_service
+        self.scorer = scorer
+        self.min_ratings = min_ratings
+        self.shrinkage = shrinkage
+        self.latency = {"content": LatencyTracker(), "hybrid": LatencyTracker()}
+        self.aligned = (None, None)
+
+    def model_rows(self, model):
+        """Row of every scorer movie in the model's item factors, -1 if the model never saw it"""
+        # recomputed only when a retrain swaps in a new model
+        if self.aligned[0] is not model:
+            rows = np.array([model.item_index.get(item, -1) for item in self.scorer.item_ids.tolist()], dtype=np.int64)
+            self.aligned = (model, rows)
+        return self.aligned[1]
+
+    def user_vector(self, ratings, preferences=None):
+        if preferences:
+            return self.scorer.genre_vector(preferences)
+        return self.scorer.vector_from_ratings(ratings)
+
+    def recommend(self, user_id, ratings, preferences=None, n=10):
+        """Top n (movie id, score) pairs and whether they are "content" or "hybrid" scores.
+
+        ratings is the user's {movie id: rating} and preferences their
+        {genre: 1-5 score}, if they gave any; user_id may be None for a user
+        who is not registered yet.
+        """
+        start = time.perf_counter()
+        scores = self.scorer.scores(self.user_vector(ratings, preferences))
+
+        model = self.model_service.model
+        state = model.user_state(user_id) if model is not None and user_id is not None else None
+        rated = set(ratings)
+        if state is not None:
+            rated.update(model.item_ids[state[2]].tolist())
+
+        mode = "content"
+        if state is not None and len(rated) >= self.min_ratings:
+            mode = "hybrid"
+            rows = self.model_rows(model)
+            collaborative = np.where(rows >= 0, model.scores(user_id)[np.maximum(rows, 0)],
+                                     np.clip(model.user_baseline(user_id), *model.rating_scale))
+            weight = len(rated) / (len(rated) + self.shrinkage)
+            scores = weight * collaborative + (1 - weight) * scores
+
+        exclude = np.isin(self.scorer.item_ids, list(rated))
+        best = top_n(scores, n, exclude)
+        recommendations = list(zip(self.scorer.item_ids[best].tolist(), scores[best].tolist()))
+        self.latency[mode].record((time.perf_counter() - start) * 1000)
+        return recommendations, mode
+
+
+def build_content_scorer(genres, survey_preferences):
+    """ContentScorer over a read_movie_genres frame; users who told us nothing get the average survey answer"""
+    return ContentScorer(genres["movieID"].to_numpy(), genres[GENRE_NAMES].to_numpy(),
+                         survey_preferences.mean().to_dict())
+
+
+def main():
+    """Time content-only recommendations for the survey respondents' genre vectors"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--requests", type=int, default=1000, help="recommendation requests to time")
+    args = parser.parse_args()
+
+    surveys = read_genre_preferences()
+    scorer = build_content_scorer(read_movie_genres(f"{DATASET_FOLDER}/u.item"), surveys)
+    latency = LatencyTracker()
+    for request in range(args.requests):
+        start = time.perf_counter()
+        vector = scorer.genre_vector(surveys.iloc[request % len(surveys)].to_dict())
+        top_n(scorer.scores(vector), 10)
+        latency.record((time.perf_counter() - start) * 1000)
+    print(f"Content scoring over {len(scorer.item_ids):,} movies: {latency.report()}")
+
+    best = top_n(scorer.scores(scorer.genre_vector(surveys.iloc[0].to_dict())), 5)
+    print(f"Top movies for {surveys.index[0]}: {scorer.item_ids[best].tolist()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,18 @@
-import pandas as pd
+import numpy as np
 from surprise import Dataset, Reader, SVD
 from surprise.model_selection import train_test_split
 from surprise import accuracy
 
-# Step 1: Load the CSV data
-df = pd.read_csv('movie_rating_matrix.csv')
-print("Data loaded:")
-print(df.head())
-
-# Step 2: Convert wide format to long format (user, movie, rating)
-ratings_list = []
-for index, row in df.iterrows():
-    user = row['Name']
-    for movie in df.columns[1:]:  # Skip the first column (Name)
-        rating = row[movie]
-        if pd.notna(rating):  # Only add if rating exists
-            ratings_list.append([user, movie, rating])
-
-# Create DataFrame in long format
-ratings_df = pd.DataFrame(ratings_list, columns=['user', 'movie', 'rating'])
+from model_service import FactorModel
+from rating_matrix import RATING_MATRIX_FILE, RatingMatrix
+from scoring import top_n
+
+# Step 1: Load the sparse rating matrix written by clean_data.py
+matrix = RatingMatrix.load(RATING_MATRIX_FILE)
+print(f"Data loaded: {matrix.shape[0]} users x {matrix.shape[1]} movies")
+
+# Step 2: Long format (user, movie, rating), one row per stored rating
+ratings_df = matrix.to_frame().rename(columns={'item': 'movie'})
 print(f"\nTotal ratings: {len(ratings_df)}")
 print("Sample ratings:")
 print(ratings_df.head())
@@ -41,37 +35,35 @@ print(f"\nModel RMSE: {rmse:.4f}")
 
 
 # Step 7: Function to get recommendations for a user
+# Copy the learned factors out of the model so every movie is scored in one matrix-vector product
+factor_model = FactorModel.from_surprise(model, trainset)
+
+
 def get_recommendations(user_name, num_recommendations=3):
     # Get all movies
-    all_movies = df.columns[1:].tolist()
-
-    # Get movies user has already rated
-    user_rated_movies = []
-    if user_name in df['Name'].values:
-        user_row = df[df['Name'] == user_name].iloc[0]
-        user_rated_movies = [movie for movie in all_movies if pd.notna(user_row[movie])]
+    all_movies = matrix.item_ids.tolist()
 
-    # Get unrated movies
-    unrated_movies = [movie for movie in all_movies if movie not in user_rated_movies]
+    # Mark the movies the user has already rated
+    already_rated = matrix.rated_mask(user_name)
 
-    # Predict ratings for unrated movies
-    predictions = []
-    for movie in unrated_movies:
-        pred = model.predict(user_name, movie)
-        predictions.append((movie, pred.est))
+    # Score every movie at once; movies missing from the training set get the user's baseline
+    item_scores = factor_model.scores(user_name)
+    movie_rows = np.array([factor_model.item_index.get(movie, -1) for movie in all_movies])
+    scores = np.where(movie_rows >= 0, item_scores[np.maximum(movie_rows, 0)], factor_model.user_baseline(user_name))
 
-    # Sort by predicted rating and return top recommendations
-    predictions.sort(key=lambda x: x[1], reverse=True)
+    # Keep the best unrated movies
+    best = top_n(scores, num_recommendations, exclude=already_rated)
+    predictions = [(all_movies[i], float(scores[i])) for i in best]
 
     print(f"\nTop {num_recommendations} recommendations for {user_name}:")
-    for i, (movie, rating) in enumerate(predictions[:num_recommendations], 1):
+    for i, (movie, rating) in enumerate(predictions, 1):
         print(f"{i}. {movie}: {rating:.2f}")
 
-    return predictions[:num_recommendations]
+    return predictions
 
 
 # Step 8: Test recommendations
-users = df['Name'].tolist()
+users = matrix.user_ids.tolist()
 print(f"\nAvailable users: {users}")
 
 # Get recommendations for the first user
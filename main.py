@@ -1,18 +1,33 @@
+import argparse
 import json
+import multiprocessing
 import os
 import random
+import time
+import urllib.request
 from random import randint
 
 import discord
 from discord.ext import commands
 from dotenv import load_dotenv
-from recommender import search
+from metrics import CommandMetrics, prometheus_summary
+from recommender import (DATASETS, IN_FLIGHT, RATING_STORE, RECOMMENDATION_CACHE, WORKERS, compact_users,
+                         follow_shared_model, genres, myratings, publish_shared_data, rate, recommend,
+                         recommendation_latency, register, retrain_model, search, similar, use_shared_data)
+from stats_server import STATS_PORT, start_stats_server
+from throttling import CommandThrottle, Throttled
+from workers import LoopLagMonitor, WorkerBusyError
 
 #pull environment variables from the .env file if they cannot be found in your OS environment
 load_dotenv()
 
 #create global variable
 DISCORD_BOT_TOKEN = os.getenv('DISCORD_TOKEN')
+# local port of the Prometheus metrics endpoint, 0 turns it off
+METRICS_PORT = int(os.getenv('METRICS_PORT', STATS_PORT))
+# Discord lets a bot identify one shard per 5 seconds, so each shard process waits for the ones started before it
+SHARD_START_INTERVAL = 5
+GATEWAY_URL = "https://discord.com/api/v10/gateway/bot"
 # declare global variable
 
 # intents form a list of actions that your bot may want to take on your server
@@ -29,11 +44,144 @@ with open("config.json", "r") as config_file:
 # Access the prefix from the config
 command_prefix = config['prefix']
 
-bot = commands.Bot(command_prefix=command_prefix, intents=intents)
+# per-command latency, errors and Discord HTTP calls, shown by !!stats and the metrics endpoint
+command_metrics = CommandMetrics()
+
+class RecommenderBot(commands.AutoShardedBot):
+    stats_runner = None
+    metrics_port = METRICS_PORT
+    # shard processes leave these to the launcher and to process 0, see run_shards
+    compact_on_close = True
+    retrains = True
+
+    async def setup_hook(self):
+        # count every Discord API request against the command that made it
+        request = self.http.request
+
+        async def counted_request(*args, **kwargs):
+            command_metrics.http_call()
+            return await request(*args, **kwargs)
+
+        self.http.request = counted_request
+        if self.metrics_port:
+            try:
+                self.stats_runner = await start_stats_server(render_metrics, port=self.metrics_port)
+            except OSError as error:
+                # a busy port only costs the metrics endpoint; !!stats still works
+                print(f"Metrics endpoint not started on port {self.metrics_port}: {error}")
+
+    async def invoke(self, ctx):
+        if ctx.command is None:
+            return await super().invoke(ctx)
+        name = ctx.command.qualified_name
+        token = command_metrics.current.set(name)
+        start = time.perf_counter()
+        try:
+            # errors do not propagate out of here, on_command_error counts them
+            await super().invoke(ctx)
+        finally:
+            command_metrics.record(name, (time.perf_counter() - start) * 1000)
+            command_metrics.current.reset(token)
+
+    async def close(self):
+        # commit ratings still waiting in the write queue before disconnecting
+        await RATING_STORE.close()
+        # fold users registered this session into u.user so the next start need not replay the log
+        if self.compact_on_close:
+            compact_users()
+        if self.stats_runner is not None:
+            await self.stats_runner.cleanup()
+        await super().close()
+
+bot = RecommenderBot(command_prefix=command_prefix, intents=intents)
+# measures how long the event loop is blocked, see workers.py
+loop_lag = LoopLagMonitor()
+# per member and per guild rate limit on the expensive commands, see throttling.py
+throttle = CommandThrottle()
+bot.add_check(throttle.check)
 bot.add_command(search)
+bot.add_command(recommend)
+bot.add_command(similar)
+bot.add_command(rate)
+bot.add_command(myratings)
+bot.add_command(register)
+bot.add_command(genres)
+
+def render_metrics():
+    """Prometheus text lines for the commands, the event loop and the worker pools"""
+    lines = command_metrics.prometheus()
+    lines += prometheus_summary("event_loop_lag_ms", loop_lag.lag)
+    for name, tracker in recommendation_latency().items():
+        lines += prometheus_summary(f"recommendation_{name}_ms", tracker)
+    for name in ("pending", "completed", "failed", "rejected", "timeouts"):
+        lines.append(f"# TYPE worker_jobs_{name} gauge")
+        lines += [f'worker_jobs_{name}{{pool="{kind}"}} {stats[name]}' for kind, stats in WORKERS.stats().items()]
+    throttled = throttle.stats()
+    lines.append("# TYPE commands_throttled_total counter")
+    lines += [f'commands_throttled_total{{scope="{scope}"}} {throttled[f"rejected_{scope}"]}'
+              for scope in ("user", "guild")]
+    flights = IN_FLIGHT.stats()
+    lines.append("# TYPE coalesced_requests_total counter")
+    lines += [f'coalesced_requests_total{{role="{role}"}} {flights[f"{role}s"]}' for role in ("leader", "follower")]
+    cache = RECOMMENDATION_CACHE.stats()
+    lines += ["# TYPE recommendation_cache_entries gauge", f"recommendation_cache_entries {cache['size']}"]
+    for name in ("hits", "misses", "evictions", "expirations", "invalidations"):
+        lines.append(f"# TYPE recommendation_cache_{name}_total counter")
+        lines.append(f"recommendation_cache_{name}_total {cache[name]}")
+    store = RATING_STORE.stats()
+    lines += ["# TYPE ratings_unflushed gauge", f"ratings_unflushed {store['unflushed']}",
+              "# TYPE rating_write_failures_total counter", f"rating_write_failures_total {store['failures']}"]
+    return lines
+
 @bot.event
 async def on_ready():
     print(f'We have logged in as {bot.user}')
+    # load the datasets in the background so commands stay responsive meanwhile
+    DATASETS.warm()
+    loop_lag.start()
+    if bot.retrains and not retrain_model.is_running():
+        retrain_model.start()
+    if not follow_shared_model.is_running():
+        follow_shared_model.start()
+
+@bot.event
+async def on_command_error(ctx, error):
+    if isinstance(error, Throttled):
+        # counted by the throttle; one reply per burst, answering every refused command would spend the budget
+        if error.notify:
+            await ctx.send(f"Slow down a little, try again in {error.retry_after:.1f} seconds.")
+        return
+    command_metrics.error(ctx.command.qualified_name if ctx.command else "unknown")
+    original = getattr(error, "original", error)
+    if isinstance(original, WorkerBusyError):
+        await ctx.send("I am busy with other requests right now, please try again in a moment.")
+    elif isinstance(original, TimeoutError):
+        await ctx.send("That took too long, please try again later.")
+    else:
+        # fall back to the default handler, which prints the traceback
+        await commands.Bot.on_command_error(bot, ctx, error)
+
+@bot.command(name="stats", help="Show command latency, errors and event loop lag.  Admins only.")
+@commands.check_any(commands.is_owner(), commands.has_guild_permissions(administrator=True))
+async def stats(ctx):
+    lines = command_metrics.report() or ["No commands run yet"]
+    lines.append(f"event loop lag: {loop_lag.lag.report()}, max {loop_lag.lag.maximum():.1f} ms")
+    lines += [f"{name} latency: {tracker.report()}" for name, tracker in recommendation_latency().items()]
+    for kind, pool in WORKERS.stats().items():
+        lines.append(f"{kind} pool: {pool['pending']} pending, {pool['completed']} done, {pool['failed']} failed, "
+                     f"{pool['rejected']} rejected, {pool['timeouts']} timed out, p99 {pool['p99_ms']:.1f} ms")
+    throttled, flights = throttle.stats(), IN_FLIGHT.stats()
+    lines.append(f"throttled: {throttled['rejected_user']} by member, {throttled['rejected_guild']} by guild; "
+                 f"coalesced: {flights['followers']} requests shared {flights['leaders']} computations")
+    cache = RECOMMENDATION_CACHE.stats()
+    lines.append(f"recommendation cache: {cache['size']}/{RECOMMENDATION_CACHE.max_size} entries, "
+                 f"{cache['hit_rate']:.0%} hits, {cache['evictions']} evicted, {cache['expirations']} expired, "
+                 f"{cache['invalidations']} invalidated")
+    store = RATING_STORE.stats()
+    last_error = f", last error {store['last_error']}" if store['failures'] else ""
+    lines.append(f"ratings: {store['written']} written, {store['unflushed']} waiting, "
+                 f"{store['failures']} failed writes{last_error}")
+    await ctx.send("```\n" + "\n".join(lines)[:1900] + "\n```")
 
 @bot.command(name="rps")
 async def rps(ctx, playerChoice):
@@ -73,8 +221,79 @@ async def ping(ctx):
 async def greeting(ctx, name):
     await ctx.send(f"Hi {name}")
 
+def run_bot():
+    try:
+        bot.run(DISCORD_BOT_TOKEN)
+    finally:
+        WORKERS.shutdown()
+
+def recommended_shards():
+    """Shard count Discord recommends for this bot"""
+    request = urllib.request.Request(GATEWAY_URL, headers={"Authorization": f"Bot {DISCORD_BOT_TOKEN}",
+                                                           "User-Agent": "DiscordBot (movie recommender, 1.0)"})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.load(response)["shards"]
+
+def run_shard(shard_ids, shard_count, index):
+    """Body of one shard process: serve shard_ids out of shard_count on the data the loader published"""
+    use_shared_data()
+    bot.shard_ids = shard_ids
+    bot.shard_count = shard_count
+    bot.metrics_port = METRICS_PORT + index if METRICS_PORT else 0
+    bot.compact_on_close = False
+    # one process retrains and publishes the model, the others map each new one in follow_shared_model
+    bot.retrains = index == 0
+    run_bot()
+
+def run_shards(shard_count, process_count):
+    """Serve shard_count shards from process_count processes that share one copy of the big tables.
+
+    A loader process builds the movie catalog, fuzzy index and model once
+    and publishes their arrays to files; every shard process memory maps
+    them read-only, so the page cache holds them once however many shards
+    run. Shards are dealt out round robin, so process i serves shards i,
+    i + process_count, and so on.
+    """
+    context = multiprocessing.get_context("spawn")
+    loader = context.Process(target=publish_shared_data, name="loader")
+    loader.start()
+    loader.join()
+    if loader.exitcode != 0:
+        raise SystemExit(f"Loading the shared data failed with exit code {loader.exitcode}")
+
+    processes = []
+    try:
+        for index in range(process_count):
+            shard_ids = list(range(shard_count))[index::process_count]
+            process = context.Process(target=run_shard, args=(shard_ids, shard_count, index), name=f"shards-{index}")
+            process.start()
+            processes.append(process)
+            print(f"Started process {index} for shards {shard_ids}")
+            if index + 1 < process_count:
+                time.sleep(SHARD_START_INTERVAL * len(shard_ids))
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # the shard processes got the interrupt too and are closing their connections
+        for process in processes:
+            process.join()
+    # the shard processes all append to the user log, only now is it safe to fold it into u.user
+    DATASETS.get("users")
+    compact_users()
+
 def main():
-    bot.run(DISCORD_BOT_TOKEN)
+    parser = argparse.ArgumentParser(description="Movie recommender Discord bot")
+    parser.add_argument("--shards", nargs="?", const="auto",
+                        help="run sharded in several processes, with this many shards or Discord's recommendation")
+    parser.add_argument("--processes", type=int, help="shard processes to run, at most one per shard by default")
+    args = parser.parse_args()
+    if args.shards is None:
+        run_bot()
+        return
+    shard_count = recommended_shards() if args.shards == "auto" else int(args.shards)
+    process_count = min(args.processes or os.cpu_count() or 1, shard_count)
+    print(f"Running {shard_count} shards in {process_count} processes")
+    run_shards(shard_count, process_count)
 
 # If this script is run (instead of imported), start the bot.
 if __name__ == '__main__':
@@ -0,0 +1,130 @@
+import bisect
+import contextvars
+import itertools
+import math
+from collections import deque
+
+# Number of recent samples kept for percentile reports
+LATENCY_WINDOW = 10_000
+
+
+class LatencyTracker:
+    """Rolling window of latencies in milliseconds"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def record(self, milliseconds):
+        self.samples.append(milliseconds)
+        self.count += 1
+
+    def percentile(self, percent):
+        """Nearest-rank percentile of the samples in the window"""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        rank = max(1, math.ceil(percent / 100 * len(ordered)))
+        return ordered[rank - 1]
+
+    def maximum(self):
+        return max(self.samples, default=0.0)
+
+    def report(self):
+        return f"{len(self.samples)} requests, p50 {self.percentile(50):.3f} ms, p99 {self.percentile(99):.3f} ms"
+
+
+# Upper bounds in milliseconds of the latency histogram buckets; one more bucket catches the rest
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Histogram:
+    """Count of observations per bucket and their sum, in the shape Prometheus expects"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+    def cumulative(self):
+        """(upper bound, observations at or below it) pairs, ending with +Inf"""
+        bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+        return list(zip(bounds, itertools.accumulate(self.counts)))
+
+
+class CommandStats:
+    def __init__(self):
+        self.latency = LatencyTracker()
+        self.histogram = Histogram()
+        self.errors = 0
+        self.http_calls = 0
+
+
+class CommandMetrics:
+    """Latency, errors and Discord HTTP calls per bot command.
+
+    The bot records each invocation with record() and each failure with
+    error(). While a command runs, its name is held in the `current`
+    context variable, so HTTP calls made anywhere inside it (including
+    tasks it starts) are attributed to it by http_call(). Recording is a
+    few dict lookups; percentiles are only computed when a report is asked for.
+    """
+
+    def __init__(self):
+        self.commands = {}
+        self.current = contextvars.ContextVar("current_command", default=None)
+
+    def stats(self, name):
+        stats = self.commands.get(name)
+        if stats is None:
+            stats = self.commands[name] = CommandStats()
+        return stats
+
+    def record(self, name, milliseconds):
+        stats = self.stats(name)
+        stats.latency.record(milliseconds)
+        stats.histogram.observe(milliseconds)
+
+    def error(self, name):
+        self.stats(name).errors += 1
+
+    def http_call(self):
+        # calls made outside any command (gateway setup, button clicks) are counted under "none"
+        self.stats(self.current.get() or "none").http_calls += 1
+
+    def report(self):
+        """One line per command, busiest first"""
+        lines = []
+        for name, stats in sorted(self.commands.items(), key=lambda item: -item[1].latency.count):
+            lines.append(f"{name}: {stats.latency.count} calls, {stats.errors} errors, {stats.http_calls} HTTP, "
+                         f"p50 {stats.latency.percentile(50):.1f} ms, p99 {stats.latency.percentile(99):.1f} ms")
+        return lines
+
+    def prometheus(self):
+        """Prometheus text format lines for every command"""
+        lines = ["# TYPE discord_command_latency_ms histogram"]
+        for name, stats in self.commands.items():
+            for bound, count in stats.histogram.cumulative():
+                lines.append(f'discord_command_latency_ms_bucket{{command="{name}",le="{bound}"}} {count}')
+            lines.append(f'discord_command_latency_ms_sum{{command="{name}"}} {stats.histogram.total:.3f}')
+            lines.append(f'discord_command_latency_ms_count{{command="{name}"}} {stats.latency.count}')
+        lines.append("# TYPE discord_command_errors_total counter")
+        lines += [f'discord_command_errors_total{{command="{name}"}} {stats.errors}'
+                  for name, stats in self.commands.items()]
+        lines.append("# TYPE discord_http_requests_total counter")
+        lines += [f'discord_http_requests_total{{command="{name}"}} {stats.http_calls}'
+                  for name, stats in self.commands.items()]
+        return lines
+
+
+def prometheus_summary(name, tracker, quantiles=(0.5, 0.9, 0.99)):
+    """Prometheus summary lines for a LatencyTracker"""
+    lines = [f"# TYPE {name} summary"]
+    lines += [f'{name}{{quantile="{quantile}"}} {tracker.percentile(quantile * 100):.3f}' for quantile in quantiles]
+    lines.append(f"{name}_sum {sum(tracker.samples):.3f}")
+    lines.append(f"{name}_count {len(tracker.samples)}")
+    return lines
@@ -0,0 +1,350 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from dataset_loader import DATASET_FOLDER
+from metrics import LatencyTracker
+from scoring import exclusion_mask, score_items, top_n, top_n_batch
+
+MODEL_FOLDER = "models"
+MODEL_FILE = f"{MODEL_FOLDER}/svd_factors.npz"
+# Bumped whenever the arrays a saved model holds change; a saved model with another layout is retrained
+MODEL_LAYOUT = 2
+# Ridge penalty per rating when folding a user's ratings into their vector
+FOLD_IN_REGULARIZATION = 0.05
+
+
+class FactorModel:
+    """User and item factor arrays of a trained SVD, scored without Surprise.
+
+    Raw (dataset) user and item ids are mapped to rows of user_factors and
+    item_factors. The ratings each user gave during training are kept in CSR
+    form (rated_indptr/rated_items/rated_values) so rated items can be left
+    out of recommendations and new ratings can be folded in on top of them.
+    Folded-in users live in the `folded` overlay until the next full retrain.
+    """
+
+    def __init__(self, user_ids, item_ids, user_factors, item_factors, user_bias, item_bias, global_mean,
+                 rating_scale, rated_indptr, rated_items, rated_values, biased=True):
+        self.user_ids = np.asarray(user_ids)
+        self.item_ids = np.asarray(item_ids)
+        self.user_factors = np.asarray(user_factors, dtype=np.float32)
+        self.item_factors = np.asarray(item_factors, dtype=np.float32)
+        self.user_bias = np.asarray(user_bias, dtype=np.float32)
+        self.item_bias = np.asarray(item_bias, dtype=np.float32)
+        self.global_mean = float(global_mean)
+        self.rating_scale = tuple(float(value) for value in rating_scale)
+        self.rated_indptr = np.asarray(rated_indptr, dtype=np.int64)
+        self.rated_items = np.asarray(rated_items, dtype=np.int32)
+        self.rated_values = np.asarray(rated_values, dtype=np.float32)
+        self.biased = bool(biased)
+        self.folded = {}
+        self.user_index = {user: row for row, user in enumerate(self.user_ids.tolist())}
+        self.item_index = {item: row for row, item in enumerate(self.item_ids.tolist())}
+
+    @classmethod
+    def from_surprise(cls, algo, trainset):
+        """Copy the factors out of a fitted surprise SVD"""
+        user_ids = [trainset.to_raw_uid(inner) for inner in range(trainset.n_users)]
+        item_ids = [trainset.to_raw_iid(inner) for inner in range(trainset.n_items)]
+        rated_indptr = np.zeros(trainset.n_users + 1, dtype=np.int64)
+        np.cumsum([len(trainset.ur[inner]) for inner in range(trainset.n_users)], out=rated_indptr[1:])
+        rated = [pair for inner in range(trainset.n_users) for pair in trainset.ur[inner]]
+        rated_items = np.fromiter((item for item, rating in rated), dtype=np.int32, count=len(rated))
+        rated_values = np.fromiter((rating for item, rating in rated), dtype=np.float32, count=len(rated))
+
+        # an unbiased SVD predicts the plain dot product, with no mean or bias terms
+        global_mean = trainset.global_mean if algo.biased else 0.0
+        return cls(user_ids, item_ids, algo.pu, algo.qi, algo.bu, algo.bi, global_mean, trainset.rating_scale,
+                   rated_indptr, rated_items, rated_values, algo.biased)
+
+    def arrays(self):
+        """Everything FactorModel(**arrays) needs, as arrays; folded-in users are not included"""
+        return {"user_ids": self.user_ids, "item_ids": self.item_ids,
+                "user_factors": self.user_factors, "item_factors": self.item_factors,
+                "user_bias": self.user_bias, "item_bias": self.item_bias,
+                "global_mean": np.array(self.global_mean), "rating_scale": np.array(self.rating_scale),
+                "rated_indptr": self.rated_indptr, "rated_items": self.rated_items, "rated_values": self.rated_values,
+                "biased": np.array(self.biased)}
+
+    def save(self, file_path=MODEL_FILE):
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        np.savez(file_path, layout=np.array(MODEL_LAYOUT), **self.arrays())
+
+    @classmethod
+    def load(cls, file_path=MODEL_FILE):
+        with np.load(file_path) as data:
+            arrays = {name: data[name] for name in data.files}
+        layout = int(arrays.pop("layout", 1))
+        if layout != MODEL_LAYOUT:
+            raise ValueError(f"{file_path} has model layout {layout}, expected {MODEL_LAYOUT}; retrain it")
+        return cls(**arrays)
+
+    def rating_count(self):
+        """Number of ratings the model was trained on"""
+        return len(self.rated_items)
+
+    def training_ratings(self, user_id):
+        """(item rows, ratings) the user gave during training"""
+        row = self.user_index.get(user_id)
+        if row is None:
+            return self.rated_items[:0], self.rated_values[:0]
+        start, end = self.rated_indptr[row], self.rated_indptr[row + 1]
+        return self.rated_items[start:end], self.rated_values[start:end]
+
+    def user_state(self, user_id):
+        """(factor vector, bias, rated item rows) for a trained or folded-in user, or None"""
+        if user_id in self.folded:
+            return self.folded[user_id]
+        row = self.user_index.get(user_id)
+        if row is None:
+            return None
+        return self.user_factors[row], self.user_bias[row], self.training_ratings(user_id)[0]
+
+    def rated_rows(self, user_id):
+        """Item rows the user has rated"""
+        state = self.user_state(user_id)
+        return self.rated_items[:0] if state is None else state[2]
+
+    def user_baseline(self, user_id):
+        """Predicted rating for an item the model has never seen"""
+        state = self.user_state(user_id)
+        return self.global_mean + (state[1] if state is not None else 0.0)
+
+    def scores(self, user_id):
+        """Predicted rating of every item for one user; unknown users get the item baseline"""
+        state = self.user_state(user_id)
+        if state is None:
+            return np.clip(self.global_mean + self.item_bias, *self.rating_scale)
+        vector, bias, rated = state
+        return score_items(vector, bias, self.item_factors, self.item_bias, self.global_mean, self.rating_scale)
+
+    def predict(self, user_id, item_id):
+        """Predicted rating of one item for one user"""
+        state = self.user_state(user_id)
+        row = self.item_index.get(item_id)
+        if row is None:
+            return float(np.clip(self.user_baseline(user_id), *self.rating_scale))
+        estimate = self.global_mean + self.item_bias[row]
+        if state is not None:
+            estimate += state[1] + self.item_factors[row] @ state[0]
+        return float(np.clip(estimate, *self.rating_scale))
+
+    def recommend(self, user_id, n=10):
+        """Top n (item_id, predicted rating) pairs the user has not rated yet"""
+        scores = self.scores(user_id)
+        exclude = np.zeros(len(scores), dtype=bool)
+        exclude[self.rated_rows(user_id)] = True
+        best = top_n(scores, n, exclude)
+        return list(zip(self.item_ids[best].tolist(), scores[best].tolist()))
+
+    def fold_in(self, user_id, new_ratings, regularization=FOLD_IN_REGULARIZATION):
+        """Fit one user's vector (and bias) to their ratings with the item factors held fixed.
+
+        new_ratings maps item id to rating and is merged over the ratings the
+        user gave in training; items the model does not know are skipped.
+        This is a single regularized least squares solve, the user half of an
+        ALS step, so it takes milliseconds instead of a full retrain.
+        Returns the number of ratings used.
+        """
+        rows, values = self.training_ratings(user_id)
+        merged = dict(zip(rows.tolist(), values.tolist()))
+        for item, rating in new_ratings.items():
+            if item in self.item_index:
+                merged[self.item_index[item]] = float(rating)
+        if not merged:
+            return 0
+
+        rows = np.fromiter(merged.keys(), dtype=np.int64, count=len(merged))
+        values = np.fromiter(merged.values(), dtype=np.float32, count=len(merged))
+        features = self.item_factors[rows]
+        targets = values - self.global_mean - self.item_bias[rows]
+        if self.biased:
+            features = np.hstack([features, np.ones((len(rows), 1), dtype=np.float32)])
+
+        penalty = regularization * len(rows) * np.eye(features.shape[1], dtype=np.float32)
+        weights = np.linalg.solve(features.T @ features + penalty, features.T @ targets)
+        vector, bias = (weights[:-1], weights[-1]) if self.biased else (weights, 0.0)
+        self.folded[user_id] = (vector.astype(np.float32), np.float32(bias), rows.astype(np.int32))
+        return len(rows)
+
+    def recommend_batch(self, user_ids=None, n=10):
+        """Top n item ids and scores for many training users at once (all of them by default).
+
+        Returns (user_ids, item_ids, scores) where the last two have one row
+        per user; unfilled slots hold item id -1 and score -inf.
+        """
+        if user_ids is None:
+            rows = np.arange(len(self.user_ids))
+        else:
+            rows = np.array([self.user_index[user] for user in user_ids], dtype=np.int64)
+
+        def exclude(batch):
+            return exclusion_mask(self.rated_indptr, self.rated_items, len(self.item_ids), rows[batch])
+
+        indices, scores = top_n_batch(self.user_factors[rows], self.user_bias[rows], self.item_factors,
+                                      self.item_bias, self.global_mean, n, self.rating_scale, exclude)
+        item_ids = np.where(indices >= 0, self.item_ids[np.maximum(indices, 0)], -1)
+        return self.user_ids[rows], item_ids, scores
+
+
+def saved_layout(file_path):
+    """Layout of a saved model file; files from before layouts were recorded are layout 1"""
+    with np.load(file_path) as data:
+        return int(data["layout"]) if "layout" in data.files else 1
+
+
+def train_model(data_for_surprise, n_factors=50, n_epochs=20, biased=True, rating_scale=(0.5, 5)):
+    """Fit a surprise SVD on a userID/itemID/rating frame and return its FactorModel"""
+    from surprise import SVD, Dataset, Reader
+
+    dataset = Dataset.load_from_df(data_for_surprise[["userID", "itemID", "rating"]], Reader(rating_scale=rating_scale))
+    trainset = dataset.build_full_trainset()
+    algo = SVD(n_factors=n_factors, n_epochs=n_epochs, biased=biased, random_state=42)
+    algo.fit(trainset)
+    return FactorModel.from_surprise(algo, trainset)
+
+
+def train_from_file(file_path, extra_ratings=None, **train_args):
+    """Train on every rating in a ratings.csv plus extra userID/itemID/rating rows, which win on conflicts"""
+    from ratings_stream import stream_ratings, to_surprise_frame
+
+    data = to_surprise_frame(stream_ratings(file_path))
+    if extra_ratings is not None and len(extra_ratings):
+        data = pd.concat([data, extra_ratings], ignore_index=True).drop_duplicates(["userID", "itemID"], keep="last")
+    print(f"Training SVD on {len(data):,} ratings...")
+    return train_model(data, **train_args)
+
+
+class ModelService:
+    """Loads the factor model once and answers recommendation requests from it"""
+
+    def __init__(self, file_path=MODEL_FILE):
+        self.file_path = file_path
+        self.model = None
+        self.load_seconds = None
+        self.latency = LatencyTracker()
+        self.fold_in_latency = LatencyTracker()
+        self.trained_at = None
+
+    def load(self, train_data=None):
+        """Load the saved model, training and saving one from train_data() when there is none"""
+        start = time.perf_counter()
+        layout = saved_layout(self.file_path) if os.path.exists(self.file_path) else None
+        if layout == MODEL_LAYOUT:
+            self.model = FactorModel.load(self.file_path)
+            self.trained_at = os.path.getmtime(self.file_path)
+        else:
+            if train_data is None:
+                raise FileNotFoundError(f"No trained model with layout {MODEL_LAYOUT} at {self.file_path}")
+            if layout is None:
+                print("No saved model found, training one...")
+            else:
+                print(f"Saved model has layout {layout}, training a new one...")
+            self.replace(train_model(train_data()))
+        self.load_seconds = time.perf_counter() - start
+        print(f"Model loaded in {self.load_seconds * 1000:.1f} ms "
+              f"({len(self.model.user_ids):,} users, {len(self.model.item_ids):,} items)")
+        return self.model
+
+    def attach(self, model, trained_at=None):
+        """Serve a model built elsewhere, such as one memory mapped from shared arrays, without saving it"""
+        self.model = model
+        self.trained_at = trained_at
+        print(f"Model attached ({len(model.user_ids):,} users, {len(model.item_ids):,} items)")
+        return model
+
+    def recommend(self, user_id, n=10):
+        start = time.perf_counter()
+        recommendations = self.model.recommend(user_id, n)
+        self.latency.record((time.perf_counter() - start) * 1000)
+        return recommendations
+
+    def fold_in(self, user_id, new_ratings):
+        start = time.perf_counter()
+        used = self.model.fold_in(user_id, new_ratings)
+        self.fold_in_latency.record((time.perf_counter() - start) * 1000)
+        return used
+
+    def replace(self, model):
+        """Swap in a freshly trained model and save it; folded-in users are part of its training data"""
+        model.save(self.file_path)
+        self.model = model
+        self.trained_at = time.time()
+
+
+def check_fold_in(data_for_surprise, n_users=200, test_fraction=0.2, seed=42, **train_args):
+    """Compare fold-in against a full retrain on the same ratings.
+
+    A sample of users is removed from training. Most of their ratings are
+    then folded into a model trained without them, and the same ratings go
+    into a full retrain; both models are scored on the rest of those users'
+    ratings. Returns (fold-in RMSE, full retrain RMSE).
+    """
+    rng = np.random.default_rng(seed)
+    counts = data_for_surprise.groupby("userID").size()
+    candidates = counts[counts >= 5].index.to_numpy()
+    chosen = rng.choice(candidates, size=min(n_users, len(candidates)), replace=False)
+    is_chosen = data_for_surprise["userID"].isin(chosen)
+    held_out = data_for_surprise[is_chosen]
+    is_test = rng.random(len(held_out)) < test_fraction
+    known, test = held_out[~is_test], held_out[is_test]
+    others = data_for_surprise[~is_chosen]
+
+    model = train_model(others, **train_args)
+    start = time.perf_counter()
+    for user, ratings in known.groupby("userID"):
+        model.fold_in(user, dict(zip(ratings["itemID"].tolist(), ratings["rating"].tolist())))
+    fold_in_ms = (time.perf_counter() - start) * 1000 / max(1, known["userID"].nunique())
+
+    start = time.perf_counter()
+    retrained = train_model(pd.concat([others, known], ignore_index=True), **train_args)
+    retrain_seconds = time.perf_counter() - start
+
+    def rmse(scored):
+        errors = [scored.predict(user, item) - rating
+                  for user, item, rating in zip(test["userID"].tolist(), test["itemID"].tolist(), test["rating"].tolist())]
+        return float(np.sqrt(np.mean(np.square(errors)))) if errors else 0.0
+
+    fold_in_rmse, retrain_rmse = rmse(model), rmse(retrained)
+    print(f"Fold-in:      RMSE {fold_in_rmse:.4f} ({fold_in_ms:.2f} ms per user)")
+    print(f"Full retrain: RMSE {retrain_rmse:.4f} ({retrain_seconds:.1f}s)")
+    return fold_in_rmse, retrain_rmse
+
+
+def main():
+    """Train on the full ratings.csv, save the factors and measure serving latency"""
+    from ratings_stream import stream_ratings, to_surprise_frame
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--requests", type=int, default=1000, help="recommendation requests to time")
+    parser.add_argument("--check-fold-in", action="store_true", help="compare fold-in RMSE with a full retrain")
+    args = parser.parse_args()
+
+    print("Streaming ratings...")
+    data_for_surprise = to_surprise_frame(stream_ratings(f"{DATASET_FOLDER}/ratings.csv"))
+    if args.check_fold_in:
+        check_fold_in(data_for_surprise)
+
+    print(f"Training SVD on {len(data_for_surprise):,} ratings...")
+    start = time.perf_counter()
+    train_model(data_for_surprise).save(MODEL_FILE)
+    print(f"Trained and saved {MODEL_FILE} in {time.perf_counter() - start:.1f}s")
+
+    service = ModelService()
+    service.load()
+    rng = np.random.default_rng(42)
+    for user_id in rng.choice(service.model.user_ids, size=args.requests).tolist():
+        service.recommend(user_id, 10)
+    print(f"Serving latency: {service.latency.report()}")
+
+    start = time.perf_counter()
+    user_ids, item_ids, scores = service.model.recommend_batch(n=10)
+    print(f"Batch top-10 for {len(user_ids):,} users in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
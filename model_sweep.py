@@ -0,0 +1,178 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from surprise import SVD, Dataset, KNNBaseline, KNNBasic, Reader, SVDpp, accuracy
+
+from dataset_loader import DATASET_FOLDER
+from model_service import MODEL_FOLDER
+from ratings_stream import sample_ratings, to_surprise_frame
+
+SWEEP_FOLDER = f"{MODEL_FOLDER}/sweep"
+RESULTS_FILE = f"{SWEEP_FOLDER}/results.csv"
+RATING_SCALE = (0.5, 5)
+N_FOLDS = 5
+# After the first fold, configs whose RMSE is this much worse than the best one are not run further
+EARLY_STOP_MARGIN = 0.05
+
+ALGORITHMS = {"SVD": SVD, "SVDpp": SVDpp, "KNNBasic": KNNBasic, "KNNBaseline": KNNBaseline}
+# KNN fits hold a dense similarity matrix per worker, so only this many of them run at once
+KNN_ALGORITHMS = {"KNNBasic", "KNNBaseline"}
+KNN_JOBS = 1
+
+
+def grid(algorithm, **options):
+    """One config per combination of the option values"""
+    names = list(options)
+    return [{"algorithm": algorithm, "params": dict(zip(names, values))}
+            for values in itertools.product(*options.values())]
+
+
+DEFAULT_GRID = (
+    grid("SVD", n_factors=[20, 50, 100], n_epochs=[20, 50], biased=[True, False])
+    + grid("SVDpp", n_factors=[20], n_epochs=[20])
+    + grid("KNNBaseline", k=[20, 40], verbose=[False],
+           sim_options=[{"name": "pearson_baseline", "user_based": False}])
+    # item based: a sample has far fewer items than users, and the matrix is n x n
+    + grid("KNNBasic", k=[40], verbose=[False], sim_options=[{"name": "msd", "user_based": False}])
+)
+
+
+def config_label(config):
+    return f"{config['algorithm']} {json.dumps(config['params'], sort_keys=True)}"
+
+
+def cache_folds(data_for_surprise, n_folds=N_FOLDS, seed=42, folder=SWEEP_FOLDER):
+    """Save the ratings and a fold number per rating once; every worker loads the same file.
+
+    The file name carries a hash of the ratings, the fold count and the seed,
+    so a later sweep over the same data reuses the same splits.
+    """
+    users = data_for_surprise["userID"].to_numpy()
+    items = data_for_surprise["itemID"].to_numpy()
+    ratings = data_for_surprise["rating"].to_numpy(dtype=np.float32)
+    digest = hashlib.sha1()
+    for array in (users, items, ratings):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    path = f"{folder}/folds-{digest.hexdigest()[:12]}-{n_folds}-{seed}.npz"
+    if os.path.exists(path):
+        print(f"Reusing cached folds {path}")
+        return path
+
+    # equal sized folds in random order
+    folds = np.random.default_rng(seed).permutation(np.arange(len(ratings)) % n_folds).astype(np.int8)
+    os.makedirs(folder, exist_ok=True)
+    np.savez(path, users=users, items=items, ratings=ratings, folds=folds)
+    print(f"Cached {n_folds} folds of {len(ratings):,} ratings in {path}")
+    return path
+
+
+def evaluate_fold(config, fold, folds_path):
+    """Train config on every fold but one and score it on that one; runs in a worker process"""
+    with np.load(folds_path) as data:
+        frame = pd.DataFrame({"userID": data["users"], "itemID": data["items"], "rating": data["ratings"]})
+        test = data["folds"] == fold
+
+    reader = Reader(rating_scale=RATING_SCALE)
+    trainset = Dataset.load_from_df(frame[~test], reader).build_full_trainset()
+    testset = list(frame[test].itertuples(index=False, name=None))
+
+    start = time.perf_counter()
+    algo = ALGORITHMS[config["algorithm"]](**config["params"])
+    algo.fit(trainset)
+    predictions = algo.test(testset)
+    seconds = time.perf_counter() - start
+    return {"rmse": accuracy.rmse(predictions, verbose=False), "mae": accuracy.mae(predictions, verbose=False),
+            "seconds": seconds}
+
+
+def evaluate_folds(jobs, folds_path, n_jobs):
+    """Scores of evaluate_fold for (config, fold) pairs, in order; KNN pairs run at most KNN_JOBS at a time"""
+    scores = [None] * len(jobs)
+    knn = [index for index, (config, fold) in enumerate(jobs) if config["algorithm"] in KNN_ALGORITHMS]
+    others = [index for index, (config, fold) in enumerate(jobs) if config["algorithm"] not in KNN_ALGORITHMS]
+    for indices, workers in ((others, n_jobs), (knn, KNN_JOBS)):
+        results = Parallel(n_jobs=workers)(delayed(evaluate_fold)(*jobs[index], folds_path) for index in indices)
+        for index, score in zip(indices, results):
+            scores[index] = score
+    return scores
+
+
+def run_sweep(folds_path, configs=DEFAULT_GRID, n_folds=N_FOLDS, n_jobs=-1, early_stop_margin=EARLY_STOP_MARGIN):
+    """Cross-validate every config in parallel and return one result row per config.
+
+    Fold 0 runs for all configs first. Configs whose fold 0 RMSE is more
+    than early_stop_margin worse than the best are stopped there; the rest
+    run their remaining folds. Pass early_stop_margin=None to run all folds.
+    """
+    scores = {index: [] for index in range(len(configs))}
+
+    print(f"Fold 0 for {len(configs)} configs...")
+    first = evaluate_folds([(config, 0) for config in configs], folds_path, n_jobs)
+    for index, score in enumerate(first):
+        scores[index].append(score)
+
+    survivors = list(range(len(configs)))
+    if early_stop_margin is not None:
+        best = min(score["rmse"] for score in first)
+        survivors = [index for index in survivors if first[index]["rmse"] <= best * (1 + early_stop_margin)]
+    print(f"{len(survivors)} configs continue, {len(configs) - len(survivors)} stopped early")
+
+    jobs = [(index, fold) for index in survivors for fold in range(1, n_folds)]
+    rest = evaluate_folds([(configs[index], fold) for index, fold in jobs], folds_path, n_jobs)
+    for (index, fold), score in zip(jobs, rest):
+        scores[index].append(score)
+
+    results = []
+    for index, config in enumerate(configs):
+        rmse = [score["rmse"] for score in scores[index]]
+        results.append({
+            "algorithm": config["algorithm"],
+            "params": json.dumps(config["params"], sort_keys=True),
+            "folds": len(rmse),
+            "stopped_early": len(rmse) < n_folds,
+            "rmse_mean": float(np.mean(rmse)),
+            "rmse_std": float(np.std(rmse)),
+            "mae_mean": float(np.mean([score["mae"] for score in scores[index]])),
+            "fit_seconds": float(np.mean([score["seconds"] for score in scores[index]])),
+        })
+    return pd.DataFrame(results).sort_values(["stopped_early", "rmse_mean"], ignore_index=True)
+
+
+def save_results(results, folds_path, results_path=RESULTS_FILE):
+    """Append the sweep to the results file, tagged with when it ran and which folds it used"""
+    results = results.assign(run_at=time.strftime("%Y-%m-%d %H:%M:%S"), folds_file=os.path.basename(folds_path))
+    os.makedirs(os.path.dirname(results_path) or ".", exist_ok=True)
+    results.to_csv(results_path, mode="a", index=False, header=not os.path.exists(results_path))
+    print(f"Results appended to {results_path}")
+
+
+def main():
+    """Cross-validate the SVD, SVD++ and KNN grid on a sample of ratings.csv"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--sample", type=int, default=100_000, help="ratings sampled from ratings.csv")
+    parser.add_argument("--folds", type=int, default=N_FOLDS)
+    parser.add_argument("--jobs", type=int, default=-1, help="worker processes, -1 for every core")
+    parser.add_argument("--no-early-stop", action="store_true", help="run every fold of every config")
+    parser.add_argument("--algorithms", nargs="+", choices=sorted(ALGORITHMS), help="only sweep these")
+    args = parser.parse_args()
+
+    configs = [config for config in DEFAULT_GRID if not args.algorithms or config["algorithm"] in args.algorithms]
+    df_ratings = sample_ratings(f"{DATASET_FOLDER}/ratings.csv", args.sample, seed=42)
+    folds_path = cache_folds(to_surprise_frame(df_ratings), args.folds)
+
+    start = time.perf_counter()
+    results = run_sweep(folds_path, configs, args.folds, args.jobs, None if args.no_early_stop else EARLY_STOP_MARGIN)
+    print(f"Swept {len(configs)} configs in {time.perf_counter() - start:.1f}s")
+    print(results.to_string(index=False))
+    save_results(results, folds_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+from bisect import bisect_left
+from collections.abc import ItemsView, Mapping, ValuesView
+
+import numpy as np
+
+from dataset_loader import GENRE_NAMES
+from snapshot import decode_text, encode_text
+
+
+class CatalogItems(ItemsView):
+    def __iter__(self):
+        catalog = self._mapping
+        return zip(catalog.ids.tolist(), decode_text(catalog.buffer, catalog.offsets))
+
+
+class CatalogValues(ValuesView):
+    def __iter__(self):
+        return iter(decode_text(self._mapping.buffer, self._mapping.offsets))
+
+
+class MovieCatalog(Mapping):
+    """Read-only {movie id: title} mapping backed by a few flat arrays.
+
+    Movie ids are kept sorted in an int32 array and found by binary search;
+    titles live in one UTF-8 byte buffer, title i being the bytes between
+    offsets[i] and offsets[i + 1], and are only decoded when asked for;
+    the 19 u.item genre flags of a movie are the bits of one uint32. That
+    is 12 bytes per movie plus its title bytes, where a dict of Python
+    ints and strings costs well over 100. Lookups, `in`, len() and
+    iteration behave like the dict this replaces. A catalog built without
+    genre flags has genre_bits None, and its genre methods raise ValueError.
+    """
+
+    def __init__(self, ids=None, buffer=None, offsets=None, genre_bits=None):
+        """Wrap arrays already laid out by build(), such as memory mapped ones; nothing is copied"""
+        self.ids = np.zeros(0, dtype=np.int32) if ids is None else ids
+        self.buffer = np.zeros(0, dtype=np.uint8) if buffer is None else buffer
+        self.offsets = np.zeros(1, dtype=np.int32) if offsets is None else offsets
+        self.genre_bits = genre_bits
+        # plain Python views, which index much faster than the arrays for one item at a time
+        self.id_view = memoryview(self.ids)
+        self.offset_view = memoryview(self.offsets)
+        self.text_view = memoryview(self.buffer)
+
+    @classmethod
+    def build(cls, ids, titles, genre_flags=None):
+        """Catalog of parallel movie ids, titles and (movies x GENRE_NAMES) 0/1 genre flags"""
+        ids = np.asarray(ids, dtype=np.int64)
+        titles = list(titles)
+        if len(titles) != len(ids):
+            raise ValueError(f"{len(ids)} movie ids but {len(titles)} titles")
+        # sorted by id, and the last title wins when an id repeats, as it would in a dict
+        order = np.argsort(ids, kind="stable")
+        keep = np.ones(len(ids), dtype=bool)
+        keep[:-1] = ids[order][1:] != ids[order][:-1]
+        order = order[keep]
+
+        buffer, offsets = encode_text([titles[i] for i in order.tolist()])
+        genre_bits = None
+        if genre_flags is not None:
+            flags = np.asarray(genre_flags, dtype=np.uint32)[order]
+            genre_bits = (flags << np.arange(len(GENRE_NAMES), dtype=np.uint32)).sum(axis=1, dtype=np.uint32)
+        return cls(ids[order].astype(np.int32), buffer,
+                   offsets.astype(np.int32) if offsets[-1] < 2 ** 31 else offsets, genre_bits)
+
+    def arrays(self):
+        """The arrays behind the catalog by constructor argument name, to save or share"""
+        arrays = {"ids": self.ids, "buffer": self.buffer, "offsets": self.offsets}
+        if self.genre_bits is not None:
+            arrays["genre_bits"] = self.genre_bits
+        return arrays
+
+    @classmethod
+    def from_frames(cls, df_movies, df_genres=None):
+        """Build from read_movies() output and, optionally, read_movie_genres() output"""
+        flags = None
+        if df_genres is not None:
+            # genres of movies missing from df_genres stay all zero
+            genres = df_genres.drop_duplicates("movieID", keep="last").set_index("movieID")[GENRE_NAMES]
+            flags = genres.reindex(df_movies["movieID"], fill_value=0).to_numpy()
+        return cls.build(df_movies["movieID"].to_numpy(), df_movies["title"].tolist(), flags)
+
+    def position(self, movie_id):
+        """Index of movie_id in the arrays, or -1"""
+        try:
+            position = bisect_left(self.id_view, movie_id)
+        except TypeError:
+            return -1
+        if position < len(self.id_view) and self.id_view[position] == movie_id:
+            return position
+        return -1
+
+    def title_at(self, position):
+        return str(self.text_view[self.offset_view[position]:self.offset_view[position + 1]], "utf-8")
+
+    def __getitem__(self, movie_id):
+        position = self.position(movie_id)
+        if position < 0:
+            raise KeyError(movie_id)
+        return self.title_at(position)
+
+    def get(self, movie_id, default=None):
+        position = self.position(movie_id)
+        return default if position < 0 else self.title_at(position)
+
+    def __contains__(self, movie_id):
+        return self.position(movie_id) >= 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids.tolist())
+
+    def items(self):
+        return CatalogItems(self)
+
+    def values(self):
+        return CatalogValues(self)
+
+    def flags(self):
+        """The packed genre bits; raises ValueError if the catalog was built without genre flags"""
+        if self.genre_bits is None:
+            raise ValueError("This catalog was built without genre flags")
+        return self.genre_bits
+
+    def genres(self, movie_id):
+        """Genre names of a movie, [] for unknown movies"""
+        genre_bits = self.flags()
+        position = self.position(movie_id)
+        if position < 0:
+            return []
+        bits = int(genre_bits[position])
+        return [name for bit, name in enumerate(GENRE_NAMES) if bits >> bit & 1]
+
+    def genre_matrix(self):
+        """0/1 flags with one row per movie in id order and one column per GENRE_NAMES entry"""
+        return (self.flags()[:, None] >> np.arange(len(GENRE_NAMES), dtype=np.uint32) & 1).astype(np.int8)
+
+    def with_genre(self, genre):
+        """Sorted ids of the movies flagged with a genre"""
+        return self.ids[self.flags() >> GENRE_NAMES.index(genre) & 1 == 1]
+
+    def nbytes(self):
+        """Bytes held by the arrays"""
+        return sum(array.nbytes for array in self.arrays().values())
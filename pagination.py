@@ -0,0 +1,108 @@
+import math
+from collections import OrderedDict
+
+import discord
+
+# Number of result lines shown on each page of a paginated reply
+RESULTS_PER_PAGE = 10
+# Number of result sets kept in a ResultCache before the oldest is dropped
+CACHE_SIZE = 128
+# Seconds the page buttons stay active after the last click
+VIEW_TIMEOUT = 180
+# Discord rejects embeds whose title is longer than this
+EMBED_TITLE_LIMIT = 256
+
+
+class ResultCache:
+    """Least recently used cache of result lines keyed by query"""
+
+    def __init__(self, max_size=CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        lines = self.entries.get(key)
+        if lines is not None:
+            self.entries.move_to_end(key)
+        return lines
+
+    def put(self, key, lines):
+        self.entries[key] = lines
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+def page_count(lines):
+    return max(1, math.ceil(len(lines) / RESULTS_PER_PAGE))
+
+
+def shorten(text, limit):
+    """text cut to at most limit characters, ending in an ellipsis when it was cut"""
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def build_page_embed(title, lines, page):
+    """Build the embed showing one page of result lines"""
+    title = shorten(title, EMBED_TITLE_LIMIT)
+    start = page * RESULTS_PER_PAGE
+    embed = discord.Embed(title=title, description="\n".join(lines[start:start + RESULTS_PER_PAGE]))
+    embed.set_footer(text=f"Page {page + 1}/{page_count(lines)} - {len(lines)} results")
+    return embed
+
+
+class PaginatedView(discord.ui.View):
+    """Previous/next buttons that page through a cached result set in place"""
+
+    def __init__(self, title, lines, author_id, timeout=VIEW_TIMEOUT):
+        super().__init__(timeout=timeout)
+        self.title = title
+        self.lines = lines
+        self.author_id = author_id
+        self.page = 0
+        self.message = None
+        self.update_buttons()
+
+    def update_buttons(self):
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page >= page_count(self.lines) - 1
+
+    async def interaction_check(self, interaction):
+        # Only the member who ran the command can turn the pages
+        return interaction.user.id == self.author_id
+
+    async def show_page(self, interaction, page):
+        self.page = page
+        self.update_buttons()
+        await interaction.response.edit_message(embed=build_page_embed(self.title, self.lines, self.page), view=self)
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction, button):
+        await self.show_page(interaction, self.page - 1)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction, button):
+        await self.show_page(interaction, self.page + 1)
+
+    async def on_timeout(self):
+        self.previous_page.disabled = True
+        self.next_page.disabled = True
+        if self.message is not None:
+            try:
+                await self.message.edit(view=self)
+            except discord.HTTPException:
+                pass
+
+
+async def send_paginated(ctx, title, lines):
+    """Send lines as a single embed, with page buttons when they need more than one page"""
+    embed = build_page_embed(title, lines, 0)
+    if page_count(lines) == 1:
+        return await ctx.send(embed=embed)
+
+    view = PaginatedView(title, lines, ctx.author.id)
+    view.message = await ctx.send(embed=embed, view=view)
+    return view.message
@@ -0,0 +1,125 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+RATING_MATRIX_FILE = "movie_ratings.npz"
+
+
+def save_ratings(path, user_ids, item_ids, rows, cols, ratings):
+    """Write the coordinate arrays in the layout RatingMatrix.load reads"""
+    np.savez_compressed(path, user_ids=np.asarray(user_ids, dtype=str), item_ids=np.asarray(item_ids, dtype=str),
+                        rows=rows, cols=cols, ratings=ratings)
+
+
+class RatingMatrix:
+    """Sparse user x item ratings with the user and item id lists.
+
+    Only the given ratings are stored, as coordinates (rows[k], cols[k],
+    ratings[k]) into user_ids and item_ids, so size follows the number of
+    ratings instead of users x items. A row-sorted (CSR) copy of the
+    coordinates answers "what did this user rate" with one slice.
+    """
+
+    def __init__(self, user_ids, item_ids, rows, cols, ratings):
+        self.user_ids = np.asarray(user_ids, dtype=str)
+        self.item_ids = np.asarray(item_ids, dtype=str)
+        self.rows = np.asarray(rows, dtype=np.int32)
+        self.cols = np.asarray(cols, dtype=np.int32)
+        self.ratings = np.asarray(ratings, dtype=np.float32)
+        self.user_index = {user: row for row, user in enumerate(self.user_ids.tolist())}
+        self.item_index = {item: col for col, item in enumerate(self.item_ids.tolist())}
+
+        order = np.argsort(self.rows, kind="stable")
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(self.rows, minlength=len(self.user_ids)))])
+        self.indices = self.cols[order]
+        self.values = self.ratings[order]
+
+    def __len__(self):
+        return len(self.ratings)
+
+    @property
+    def shape(self):
+        return len(self.user_ids), len(self.item_ids)
+
+    @classmethod
+    def from_wide(cls, df, id_column="Name"):
+        """Build from a frame with one row per user and one rating column per item; NaN means not rated"""
+        items = df.columns.drop(id_column)
+        values = df[items].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float32)
+        user_codes, user_ids = pd.factorize(df[id_column].fillna(""))
+        # row-major order, the same order as walking the frame row by row
+        rows, cols = np.nonzero(~np.isnan(values))
+        return cls(user_ids, items, user_codes[rows], cols, values[rows, cols])
+
+    def save(self, path=RATING_MATRIX_FILE):
+        save_ratings(path, self.user_ids, self.item_ids, self.rows, self.cols, self.ratings)
+
+    @classmethod
+    def load(cls, path=RATING_MATRIX_FILE):
+        with np.load(path) as data:
+            return cls(data["user_ids"], data["item_ids"], data["rows"], data["cols"], data["ratings"])
+
+    def to_frame(self):
+        """Long format (user, item, rating) rows, ready for surprise.Dataset.load_from_df"""
+        return pd.DataFrame({"user": self.user_ids[self.rows], "item": self.item_ids[self.cols],
+                             "rating": self.ratings})
+
+    def user_ratings(self, user_id):
+        """(item columns, ratings) of one user; empty for unknown users"""
+        row = self.user_index.get(user_id)
+        if row is None:
+            return self.indices[:0], self.values[:0]
+        start, end = self.indptr[row], self.indptr[row + 1]
+        return self.indices[start:end], self.values[start:end]
+
+    def rated_mask(self, user_id):
+        """Boolean mask over item_ids of the items user_id has rated"""
+        mask = np.zeros(len(self.item_ids), dtype=bool)
+        mask[self.user_ratings(user_id)[0]] = True
+        return mask
+
+
+class RatingMatrixWriter:
+    """Builds a rating matrix file from parts over the same items without keeping the parts in memory.
+
+    Each part's coordinates are appended to raw files in folder as it is
+    added; only the user id to row dict stays in memory, so a user that
+    appears in several parts keeps one row. close() writes the .npz from
+    memory maps of those files.
+    """
+
+    def __init__(self, path, folder):
+        self.path = path
+        self.folder = folder
+        self.item_ids = None
+        self.user_index = {}
+        self.files = {name: open(os.path.join(folder, name), "wb") for name in ("rows", "cols", "ratings")}
+
+    def add(self, matrix):
+        if self.item_ids is None:
+            self.item_ids = matrix.item_ids
+        elif not np.array_equal(matrix.item_ids, self.item_ids):
+            raise ValueError("Rating matrices have different items")
+        codes = np.array([self.user_index.setdefault(user, len(self.user_index)) for user in matrix.user_ids.tolist()],
+                         dtype=np.int32)
+        codes[matrix.rows].tofile(self.files["rows"])
+        matrix.cols.tofile(self.files["cols"])
+        matrix.ratings.tofile(self.files["ratings"])
+
+    def close(self):
+        """Write the .npz, unless no part was added"""
+        for handle in self.files.values():
+            handle.close()
+        if self.item_ids is None:
+            return
+        arrays = {}
+        for name, dtype in (("rows", np.int32), ("cols", np.int32), ("ratings", np.float32)):
+            file_path = os.path.join(self.folder, name)
+            if os.path.getsize(file_path):
+                arrays[name] = np.memmap(file_path, dtype=dtype, mode="r")
+            else:
+                # np.memmap cannot map an empty file
+                arrays[name] = np.empty(0, dtype=dtype)
+        save_ratings(self.path, list(self.user_index), self.item_ids, arrays["rows"], arrays["cols"],
+                     arrays["ratings"])
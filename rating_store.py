@@ -0,0 +1,187 @@
+import asyncio
+import time
+
+import aiosqlite
+
+RATINGS_DATABASE = "ratings.db"
+# Most ratings written in one transaction
+BATCH_SIZE = 500
+# Seconds the writer waits for more ratings before committing a partial batch
+FLUSH_INTERVAL = 0.05
+# Seconds before a failed batch is written again, doubling after each failure up to MAX_RETRY_DELAY
+RETRY_DELAY = 0.5
+MAX_RETRY_DELAY = 30
+# Seconds close() waits for queued ratings to be committed before giving up on them
+CLOSE_TIMEOUT = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ratings (
+    discord_id INTEGER NOT NULL,
+    movie_id INTEGER NOT NULL,
+    rating REAL NOT NULL,
+    rated_at REAL NOT NULL,
+    PRIMARY KEY (discord_id, movie_id)
+) WITHOUT ROWID
+"""
+
+GENRE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS genre_preferences (
+    discord_id INTEGER NOT NULL,
+    genre TEXT NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (discord_id, genre)
+) WITHOUT ROWID
+"""
+
+UPSERT = """
+INSERT INTO ratings (discord_id, movie_id, rating, rated_at) VALUES (?, ?, ?, ?)
+ON CONFLICT (discord_id, movie_id) DO UPDATE SET rating = excluded.rating, rated_at = excluded.rated_at
+"""
+
+GENRE_UPSERT = """
+INSERT INTO genre_preferences (discord_id, genre, score) VALUES (?, ?, ?)
+ON CONFLICT (discord_id, genre) DO UPDATE SET score = excluded.score
+"""
+
+
+class RatingStore:
+    """Ratings keyed by (discord user, movie) in SQLite, written behind a queue.
+
+    add() only queues the rating and returns; a single writer task drains
+    the queue and commits up to BATCH_SIZE ratings per transaction, so the
+    event loop never waits on disk. Ratings that are queued but not yet
+    committed are still visible to user_ratings(). A batch that fails to
+    commit stays queued and is retried with backoff until it goes through.
+    The table is clustered
+    on (discord_id, movie_id), which makes reading one user's ratings an
+    index range scan.
+    """
+
+    def __init__(self, path=RATINGS_DATABASE, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.db = None
+        self.queue = None
+        self.writer = None
+        self.unflushed = {}
+        self.open_lock = asyncio.Lock()
+        self.written = 0
+        self.failures = 0
+        self.last_error = None
+
+    async def open(self):
+        async with self.open_lock:
+            if self.db is not None:
+                return
+            db = await aiosqlite.connect(self.path)
+            await db.execute("PRAGMA journal_mode=WAL")
+            await db.execute("PRAGMA synchronous=NORMAL")
+            await db.execute(SCHEMA)
+            await db.execute(GENRE_SCHEMA)
+            await db.commit()
+            self.db = db
+            self.queue = asyncio.Queue()
+            self.writer = asyncio.get_running_loop().create_task(self._write_batches())
+
+    async def add(self, discord_id, movie_id, rating):
+        """Queue a rating; the latest rating for the same user and movie wins"""
+        await self.open()
+        row = (int(discord_id), int(movie_id), float(rating), time.time())
+        self.unflushed[row[:2]] = row
+        self.queue.put_nowait(row)
+
+    async def _write_batches(self):
+        while True:
+            rows = [await self.queue.get()]
+            # give concurrent ratings a moment to join this transaction
+            if self.queue.qsize() < self.batch_size:
+                await asyncio.sleep(self.flush_interval)
+            while len(rows) < self.batch_size and not self.queue.empty():
+                rows.append(self.queue.get_nowait())
+
+            latest = {row[:2]: row for row in rows}
+            delay = RETRY_DELAY
+            while not await self._write(latest):
+                print(f"Failed to write {len(latest)} ratings, retrying in {delay:.1f} s: {self.last_error!r}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+            self.written += len(latest)
+            for key, row in latest.items():
+                # a newer rating for the same key may have been queued meanwhile
+                if self.unflushed.get(key) is row:
+                    del self.unflushed[key]
+            for _ in rows:
+                self.queue.task_done()
+
+    async def _write(self, latest):
+        """Commit one batch; False, with the error kept in last_error, when it failed"""
+        try:
+            await self.db.executemany(UPSERT, list(latest.values()))
+            await self.db.commit()
+            return True
+        except Exception as error:
+            self.failures += 1
+            self.last_error = error
+            try:
+                await self.db.rollback()
+            except Exception:
+                pass
+            return False
+
+    async def flush(self):
+        """Wait until every queued rating is committed"""
+        if self.queue is not None:
+            await self.queue.join()
+
+    async def user_ratings(self, discord_id):
+        """{movie_id: rating} for one user, newest first"""
+        await self.open()
+        discord_id = int(discord_id)
+        rows = {}
+        async with self.db.execute("SELECT movie_id, rating, rated_at FROM ratings WHERE discord_id = ?",
+                                   (discord_id,)) as cursor:
+            for movie_id, rating, rated_at in await cursor.fetchall():
+                rows[movie_id] = (rating, rated_at)
+        for (user, movie_id), row in list(self.unflushed.items()):
+            if user == discord_id:
+                rows[movie_id] = (row[2], row[3])
+        ordered = sorted(rows.items(), key=lambda item: item[1][1], reverse=True)
+        return {movie_id: rating for movie_id, (rating, rated_at) in ordered}
+
+    async def all_ratings(self):
+        """Every stored (discord_id, movie_id, rating), after committing the queue"""
+        await self.open()
+        await self.flush()
+        async with self.db.execute("SELECT discord_id, movie_id, rating FROM ratings") as cursor:
+            return await cursor.fetchall()
+
+    async def set_genres(self, discord_id, preferences):
+        """Store {genre: score} for a user, replacing earlier scores for the same genres"""
+        await self.open()
+        # genre scores change rarely, so they are written straight away instead of through the queue
+        await self.db.executemany(GENRE_UPSERT, [(int(discord_id), genre, float(score))
+                                                 for genre, score in preferences.items()])
+        await self.db.commit()
+
+    async def genres(self, discord_id):
+        """{genre: score} a user has set, empty if none"""
+        await self.open()
+        async with self.db.execute("SELECT genre, score FROM genre_preferences WHERE discord_id = ?",
+                                   (int(discord_id),)) as cursor:
+            return dict(await cursor.fetchall())
+
+    def stats(self):
+        return {"written": self.written, "unflushed": len(self.unflushed), "failures": self.failures,
+                "last_error": None if self.last_error is None else repr(self.last_error)}
+
+    async def close(self):
+        if self.db is None:
+            return
+        try:
+            await asyncio.wait_for(self.flush(), CLOSE_TIMEOUT)
+        except TimeoutError:
+            print(f"Gave up on {len(self.unflushed)} ratings that could not be written: {self.last_error!r}")
+        self.writer.cancel()
+        await self.db.close()
+        self.db = None
@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+
+RATINGS_COLUMNS = ["userId", "movieId", "rating"]
+RATINGS_DTYPES = {"userId": "int32", "movieId": "int32", "rating": "float32"}
+# Rows parsed per chunk; memory use is bounded by this plus the sample size
+CHUNK_SIZE = 500_000
+
+
+class RatingsSummary:
+    """Row count, distinct users/movies and rating range, gathered chunk by chunk"""
+
+    def __init__(self):
+        self.rows = 0
+        self.users = set()
+        self.movies = set()
+        self.rating_sum = 0.0
+        self.rating_min = None
+        self.rating_max = None
+
+    def update(self, chunk):
+        if chunk.empty:
+            return
+        self.rows += len(chunk)
+        self.users.update(np.unique(chunk["userId"].to_numpy()).tolist())
+        self.movies.update(np.unique(chunk["movieId"].to_numpy()).tolist())
+        ratings = chunk["rating"].to_numpy()
+        self.rating_sum += float(ratings.sum(dtype=np.float64))
+        low, high = float(ratings.min()), float(ratings.max())
+        self.rating_min = low if self.rating_min is None else min(self.rating_min, low)
+        self.rating_max = high if self.rating_max is None else max(self.rating_max, high)
+
+    def print_report(self):
+        print(f"Number of ratings: {self.rows:,}")
+        print(f"Number of unique users: {len(self.users):,}")
+        print(f"Number of unique movies: {len(self.movies):,}")
+        if self.rows:
+            print(f"Rating range: {self.rating_min} to {self.rating_max}")
+            print(f"Average rating: {self.rating_sum / self.rows:.2f}")
+
+
+def empty_ratings():
+    return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in RATINGS_DTYPES.items()})
+
+
+def iter_rating_chunks(file_path, chunksize=CHUNK_SIZE):
+    """Yield the userId/movieId/rating columns of a ratings CSV in compact chunks"""
+    return pd.read_csv(file_path, usecols=RATINGS_COLUMNS, dtype=RATINGS_DTYPES, chunksize=chunksize)
+
+
+def sample_ratings(file_path, sample_size, seed=42, chunksize=CHUNK_SIZE, summary=None):
+    """Uniform random sample of sample_size ratings in one pass over the file.
+
+    Every row gets a random priority and the reservoir keeps the sample_size
+    rows with the smallest priorities, so the result is the same for a given
+    seed no matter how the file is chunked and only O(sample_size + chunksize)
+    rows are ever held in memory.
+    """
+    if sample_size <= 0:
+        return empty_ratings()
+
+    rng = np.random.default_rng(seed)
+    reservoir = None
+    priorities = np.empty(0, dtype=np.float64)
+
+    for chunk in iter_rating_chunks(file_path, chunksize):
+        if summary is not None:
+            summary.update(chunk)
+        chunk_priorities = rng.random(len(chunk))
+
+        # once the reservoir is full only rows beating its worst priority can get in
+        if len(priorities) >= sample_size:
+            keep = chunk_priorities < priorities.max()
+            chunk, chunk_priorities = chunk[keep], chunk_priorities[keep]
+            if chunk.empty:
+                continue
+
+        reservoir = chunk if reservoir is None else pd.concat([reservoir, chunk], ignore_index=True)
+        priorities = np.concatenate([priorities, chunk_priorities])
+        if len(priorities) > sample_size:
+            keep = np.argpartition(priorities, sample_size)[:sample_size]
+            reservoir, priorities = reservoir.iloc[keep].reset_index(drop=True), priorities[keep]
+
+    if reservoir is None:
+        return empty_ratings()
+    order = np.argsort(priorities, kind="stable")
+    return reservoir.iloc[order].reset_index(drop=True)
+
+
+def sample_ratings_per_user(file_path, per_user, seed=42, chunksize=CHUNK_SIZE, summary=None):
+    """Keep up to per_user randomly chosen ratings for every user, in one pass over the file"""
+    rng = np.random.default_rng(seed)
+    reservoir = None
+
+    for chunk in iter_rating_chunks(file_path, chunksize):
+        if summary is not None:
+            summary.update(chunk)
+        chunk = chunk.assign(priority=rng.random(len(chunk)))
+        reservoir = chunk if reservoir is None else pd.concat([reservoir, chunk], ignore_index=True)
+        reservoir = reservoir.sort_values(["userId", "priority"], kind="stable")
+        reservoir = reservoir[reservoir.groupby("userId").cumcount() < per_user].reset_index(drop=True)
+
+    if reservoir is None:
+        return empty_ratings()
+    return reservoir.drop(columns="priority")
+
+
+def stream_ratings(file_path, chunksize=CHUNK_SIZE, summary=None):
+    """Read every rating into int32/int32/float32 arrays for training"""
+    users, movies, ratings = [], [], []
+    for chunk in iter_rating_chunks(file_path, chunksize):
+        if summary is not None:
+            summary.update(chunk)
+        users.append(chunk["userId"].to_numpy())
+        movies.append(chunk["movieId"].to_numpy())
+        ratings.append(chunk["rating"].to_numpy())
+    return {
+        "userId": np.concatenate(users) if users else np.empty(0, dtype=np.int32),
+        "movieId": np.concatenate(movies) if movies else np.empty(0, dtype=np.int32),
+        "rating": np.concatenate(ratings) if ratings else np.empty(0, dtype=np.float32),
+    }
+
+
+def to_surprise_frame(ratings):
+    """Rename a ratings table (or stream_ratings arrays) to the userID/itemID/rating columns Surprise expects"""
+    df = pd.DataFrame(ratings, copy=False)
+    return df.rename(columns={'userId': 'userID', 'movieId': 'itemID'})[['userID', 'itemID', 'rating']]
@@ -1,85 +1,494 @@
+import time
+import traceback
+
 import pandas as pd
-from discord.ext import commands
+from discord.ext import commands, tasks
+
+from dataset_loader import (GENRE_NAMES, discord_user_mapping, measure_load, next_user_id, read_movie_genres,
+                            read_movies, read_users)
+from dataset_registry import DatasetRegistry
+from fuzzy_index import FuzzyIndex
+from hybrid_recommender import (MAX_GENRE_SCORE, MIN_GENRE_SCORE, HybridRecommender, build_content_scorer,
+                                read_genre_preferences)
+from model_service import FactorModel, ModelService, train_from_file
+from movie_catalog import MovieCatalog
+from pagination import ResultCache, send_paginated
+from rating_store import RatingStore
+from ratings_stream import sample_ratings, to_surprise_frame
+from shared_data import SHARED_FOLDER, attach, publish, published_generation, withdraw
+from similarity_index import SimilarityIndex
+from snapshot import cached_read
+from throttling import SingleFlight
+from title_index import TitleIndex, normalize_title
+from user_cache import UserResultCache
+from user_registry import UserRegistry
+from workers import WorkerPool
 
 #Define global variables
 DATASET_FOLDER = "ml-from-2015"
 
-NEXT_USER_ID = 0
 DISCORD_USER_MAPPING = {}
-MOVIE_TITLE_MAPPING = {}
-RATINGS_MAPPING = {}
+# {movie id: title} as flat arrays, see movie_catalog.py; replaced by the full catalog in load_movies.
+# It has no genre flags and its genre methods raise; load_similarity and load_content read genres themselves,
+# so searches never wait on them
+MOVIE_TITLE_MAPPING = MovieCatalog()
+
+# Hands out dataset user ids to new Discord users and keeps DISCORD_USER_MAPPING up to date
+USER_REGISTRY = UserRegistry(DISCORD_USER_MAPPING)
+
+# Ratings given through !!rate, stored in ratings.db by discord user and movie
+RATING_STORE = RatingStore()
+MIN_RATING = 1.0
+MAX_RATING = 5.0
+
+# Number of ratings sampled from ratings.csv when the bot loads its data
+RATINGS_SAMPLE_SIZE = 1000
+
+# Search indexes over MOVIE_TITLE_MAPPING titles and movie ids, built in load_movies
+MOVIE_TITLE_INDEX = None
+MOVIE_ID_INDEX = None
+
+# Typo tolerant index for "did you mean" suggestions, built in load_fuzzy, and how many it offers
+FUZZY_TITLE_INDEX = None
+SUGGESTION_LIMIT = 5
+
+# Most matches a single search returns, and the cache of ranked results keyed by query
+SEARCH_RESULT_LIMIT = 250
+SEARCH_RESULTS_CACHE = ResultCache()
+
+# Serves recommendations from the saved SVD factors, see model_service.py
+MODEL_SERVICE = ModelService()
+# Most recommendations a single !!recommend returns
+MAX_RECOMMENDATIONS = 50
+# Hours between full retrains on ratings.csv and the !!rate ratings; new ratings are folded in immediately in between
+RETRAIN_INTERVAL_HOURS = 24
+RETRAIN_TIMEOUT = 3600
+
+# Genre based scores for users with few ratings, blended with MODEL_SERVICE otherwise; built in load_content
+HYBRID_RECOMMENDER = None
+# !!recommend results per (Discord user, n); a user's entries are dropped when their ratings or genres change
+RECOMMENDATION_CACHE = UserResultCache()
+
+# LSH index over the u.item genre flags for !!similar, built in load_similarity
+SIMILARITY_INDEX = None
+# Movies listed by !!similar, and extra LSH buckets probed per table (higher = better recall, slower)
+SIMILAR_RESULTS = 10
+SIMILAR_PROBES = 2
+
+# CPU-bound command work runs here instead of on the event loop
+WORKERS = WorkerPool()
+# identical requests arriving while one is being computed wait for it instead of computing it again
+IN_FLIGHT = SingleFlight()
+
+# Datasets load on first use (or in the background after on_ready), never at import time
+DATASETS = DatasetRegistry()
+
+# In shard processes, the folder the launcher's loader process published the catalog, fuzzy index and
+# model arrays to (see use_shared_data), and the generation of each one this process has mapped
+SHARED_DATA_FOLDER = None
+SHARED_GENERATIONS = {}
+# Minutes between checks for a model republished by the shard process that retrains
+SHARED_REFRESH_MINUTES = 5
 
 def load_users():
-    global NEXT_USER_ID
     # load u.user
-    df_users = pd.read_csv(f"{DATASET_FOLDER}/u.user",
-                           sep="|",
-                           names=["userID", "age", "gender", "username", "discordID"])
+    df_users = measure_load("u.user", cached_read, "users", f"{DATASET_FOLDER}/u.user", read_users)
+    DISCORD_USER_MAPPING.update(discord_user_mapping(df_users))
+    # ids continue after u.user, then users registered since the last compaction are replayed
+    USER_REGISTRY.reset(next_user_id(df_users))
     print("Dataset users loaded")
-    discord_users = df_users[df_users["gender"] == "D"]
-    for index, row in discord_users.iterrows():
-        DISCORD_USER_MAPPING[int(row['discordID'])] = row['userID']
-    NEXT_USER_ID = max(df_users["userID"].tolist(), default=0) + 1
+    return DISCORD_USER_MAPPING
+
+def use_shared_data(folder=SHARED_FOLDER):
+    """Map the catalog, fuzzy index and model published in folder instead of building them in this process"""
+    global SHARED_DATA_FOLDER
+    SHARED_DATA_FOLDER = folder
 
-load_users()
+def attach_shared(name):
+    """Memory mapped arrays of a shared dataset, or None when this process has to build its own"""
+    if SHARED_DATA_FOLDER is None:
+        return None
+    attached = attach(name, SHARED_DATA_FOLDER)
+    if attached is None:
+        print(f"Nothing published for {name} in {SHARED_DATA_FOLDER}, building it in this process")
+        return None
+    SHARED_GENERATIONS[name], arrays = attached
+    return arrays
+
+def publish_shared_data(folder=SHARED_FOLDER):
+    """Build the catalog, fuzzy index and model here and publish their arrays for the shard processes.
+
+    Without a saved model or ratings.csv to train one, the catalog and fuzzy
+    index are still published and the model is not; the shard processes then
+    try to load it themselves and, like a single process would, fall back to
+    genre based recommendations.
+    """
+    for name, dataset in (("catalog", "movies"), ("fuzzy", "fuzzy")):
+        publish(name, DATASETS.get(dataset).arrays(), folder)
+        print(f"Published {name} to {folder}")
+    try:
+        model = DATASETS.get("model")
+    except Exception:
+        print("No model to publish:")
+        traceback.print_exc()
+        # a model left over from an earlier run must not be served instead
+        withdraw("model", folder)
+        return
+    publish("model", model.arrays(), folder)
+    print(f"Published model to {folder}")
 
 def load_movies():
-    # Read the movies data from the u.item
-    df_movies = pd.read_csv(f"{DATASET_FOLDER}/u.item",
-                            usecols=[0, 1],
-                            sep="|",
-                            names=["movieID", "title"],
-                            encoding='ISO-8859-1')
-
-    print(df_movies.head())
-    # fill the MOVIE_TITLE_MAPPING DIRECTORY
-    for index, row in df_movies.iterrows():
-        MOVIE_TITLE_MAPPING[int(row['movieID'])] = row['title']
+    global MOVIE_TITLE_MAPPING, MOVIE_TITLE_INDEX, MOVIE_ID_INDEX
+    arrays = attach_shared("catalog")
+    if arrays is not None:
+        MOVIE_TITLE_MAPPING = MovieCatalog(**arrays)
+    else:
+        # Read the movies data from the u.item
+        df_movies = measure_load("u.item", cached_read, "movies", f"{DATASET_FOLDER}/u.item", read_movies)
+        # the frame is dropped once the catalog has copied it into its arrays
+        MOVIE_TITLE_MAPPING = MovieCatalog.from_frames(df_movies)
+
+    # build the search indexes once so search never scans MOVIE_TITLE_MAPPING
+    MOVIE_TITLE_INDEX = TitleIndex(MOVIE_TITLE_MAPPING)
+    MOVIE_ID_INDEX = TitleIndex({movie: str(movie) for movie in MOVIE_TITLE_MAPPING})
 
     print("Movies loaded")
+    return MOVIE_TITLE_MAPPING
 
-load_movies()
+def load_fuzzy():
+    global FUZZY_TITLE_INDEX
+    # a separate dataset so its few seconds of building never hold up plain searches
+    arrays = attach_shared("fuzzy")
+    if arrays is not None:
+        FUZZY_TITLE_INDEX = FuzzyIndex(**arrays)
+        return FUZZY_TITLE_INDEX
+    titles = DATASETS.get("movies")
+    start = time.perf_counter()
+    FUZZY_TITLE_INDEX = FuzzyIndex.build(titles)
+    print(f"Fuzzy title index built in {time.perf_counter() - start:.1f}s")
+    return FUZZY_TITLE_INDEX
 
 def load_ratings():
-    global NEXT_USER_ID
-    # load u.user
-    df_ratings = pd.read_csv(f"{DATASET_FOLDER}/ratings.csv")
-
-    DATA_COUNT = 1000
-    DATA_FRACTION = DATA_COUNT / df_ratings.shape[0]
-    # Sample a fraction of the data if specified
-    if DATA_FRACTION < 1.0:
-        df_ratings = df_ratings.sample(frac=DATA_FRACTION, random_state=42).reset_index(drop=True)
-        print(f"Using {len(df_ratings):,} ratings ({DATA_FRACTION * 100:.5f}% of total)")
-    data_for_surprise = df_ratings.rename(columns={
-        'userId': 'userID',
-        'movieId': 'itemID'
-    })
-    # print(data_for_surprise.head())
-    data_for_surprise = data_for_surprise[['userID', 'itemID', 'rating']]
+    # stream ratings.csv and keep a fixed size random sample instead of reading it all
+    df_ratings = measure_load("ratings.csv", sample_ratings, f"{DATASET_FOLDER}/ratings.csv", RATINGS_SAMPLE_SIZE,
+                              seed=42)
+    print(f"Using {len(df_ratings):,} sampled ratings")
+    data_for_surprise = to_surprise_frame(df_ratings)
     print("Dataset ratings loaded")
+    return data_for_surprise
+
+def load_model():
+    arrays = attach_shared("model")
+    if arrays is not None:
+        model = MODEL_SERVICE.attach(FactorModel(**arrays))
+    else:
+        # train from the sampled ratings only when no saved model exists yet
+        model = MODEL_SERVICE.load(train_data=lambda: DATASETS.get("ratings"))
+    # results cached before the model was there are genre based only
+    RECOMMENDATION_CACHE.clear()
+    return model
+
+def load_similarity():
+    global SIMILARITY_INDEX
+    genres = measure_load("u.item genres", cached_read, "genres", f"{DATASET_FOLDER}/u.item", read_movie_genres)
+    SIMILARITY_INDEX = SimilarityIndex(genres["movieID"].to_numpy(), genres[GENRE_NAMES].to_numpy())
+    print("Similarity index built")
+    return SIMILARITY_INDEX
+
+def load_content():
+    global HYBRID_RECOMMENDER
+    genres = measure_load("u.item genres", cached_read, "genres", f"{DATASET_FOLDER}/u.item", read_movie_genres)
+    scorer = build_content_scorer(genres, read_genre_preferences())
+    HYBRID_RECOMMENDER = HybridRecommender(MODEL_SERVICE, scorer)
+    print("Content scorer built")
+    return HYBRID_RECOMMENDER
+
+def compact_users():
+    """Move registered users from the log into u.user and its snapshot"""
+    if not DATASETS.is_loaded("users"):
+        return
+    moved = USER_REGISTRY.compact(f"{DATASET_FOLDER}/u.user",
+                                  rebuild_snapshot=lambda: cached_read("users", f"{DATASET_FOLDER}/u.user", read_users))
+    if moved:
+        print(f"Compacted {moved} registered users into u.user")
+
+DATASETS.register("users", load_users)
+DATASETS.register("movies", load_movies)
+DATASETS.register("ratings", load_ratings)
+DATASETS.register("model", load_model)
+DATASETS.register("similarity", load_similarity)
+DATASETS.register("content", load_content)
+# last, so the warm-up has every dataset a command needs before it spends seconds on suggestions
+DATASETS.register("fuzzy", load_fuzzy)
 
-load_ratings()
+async def ensure_datasets(ctx, *names):
+    """Return True if the datasets are loaded, otherwise start warming them up and tell the user"""
+    if DATASETS.ready(*names):
+        return True
+    failed = DATASETS.failed(*names)
+    if failed:
+        # warming again would only fail again, the log has the traceback
+        await ctx.send(f"The {', '.join(failed)} data could not be loaded, so this command is unavailable right now.")
+        return False
+    DATASETS.warm()
+    await ctx.send("The movie data is still warming up, please try again in a few seconds.")
+    return False
+
+def search_movies(movie_name):
+    """Return ranked result lines for a query, title matches first then movie id matches"""
+    title_matches = MOVIE_TITLE_INDEX.search(movie_name, limit=SEARCH_RESULT_LIMIT)
+    lines = [f"{MOVIE_TITLE_MAPPING[movie]} is {movie}" for movie in title_matches]
+
+    # ids whose digits contain the query, skipping movies already matched by title
+    matched = set(title_matches)
+    for movie in MOVIE_ID_INDEX.search(movie_name, limit=SEARCH_RESULT_LIMIT):
+        if len(lines) >= SEARCH_RESULT_LIMIT:
+            break
+        if movie not in matched:
+            lines.append(f"{movie} is {MOVIE_TITLE_MAPPING[movie]}")
+    return lines
+
+def suggest_movies(movie_name):
+    """Titles close to a query that matched nothing, or [] until the startup warm-up has built the fuzzy index"""
+    # never built from here: a search for a typo would otherwise slow down every search running meanwhile
+    if not DATASETS.is_loaded("fuzzy"):
+        return []
+    return FUZZY_TITLE_INDEX.suggest(movie_name, SUGGESTION_LIMIT)
+
+def resolve_movie(movie_name):
+    """Find the movie id for an exact id or the best title match, allowing typos, or None"""
+    movie_name = movie_name.strip()
+    if movie_name.isdigit() and int(movie_name) in MOVIE_TITLE_MAPPING:
+        return int(movie_name)
+    matches = MOVIE_TITLE_INDEX.search(movie_name, limit=1) or suggest_movies(movie_name)
+    return matches[0] if matches else None
+
+async def collect_stored_ratings():
+    """Every !!rate rating from users in DISCORD_USER_MAPPING, as a userID/itemID/rating frame"""
+    stored = [(DISCORD_USER_MAPPING[discord_id], movie_id, rating)
+              for discord_id, movie_id, rating in await RATING_STORE.all_ratings()
+              if discord_id in DISCORD_USER_MAPPING]
+    return pd.DataFrame(stored, columns=["userID", "itemID", "rating"])
+
+@tasks.loop(hours=RETRAIN_INTERVAL_HOURS)
+async def retrain_model():
+    # the loop fires once when started; the model loaded at startup is fresh enough
+    if retrain_model.current_loop == 0 or not DATASETS.ready("users", "model"):
+        return
+    # an exception escaping a tasks.loop stops it for good, so a failed retrain only waits for the next interval
+    try:
+        await retrain()
+    except Exception:
+        print("Retraining failed, keeping the current model:")
+        traceback.print_exc()
+
+async def retrain():
+    """Train on the full ratings.csv plus the !!rate ratings and serve the result if it saw at least as much data"""
+    print("Retraining the recommendation model...")
+    stored = await collect_stored_ratings()
+    model = await WORKERS.run_process(train_from_file, f"{DATASET_FOLDER}/ratings.csv", stored,
+                                      timeout=RETRAIN_TIMEOUT)
+    current = MODEL_SERVICE.model
+    if current is not None and model.rating_count() < current.rating_count():
+        # say a model trained offline by model_service.py on more ratings than this process can see
+        print(f"Retrained model saw {model.rating_count():,} ratings, the current one {current.rating_count():,}; "
+              "keeping the current model")
+        return
+    await WORKERS.run_thread(MODEL_SERVICE.replace, model)
+    RECOMMENDATION_CACHE.clear()
+    if SHARED_DATA_FOLDER is not None:
+        # the other shard processes switch to it in follow_shared_model
+        SHARED_GENERATIONS["model"] = await WORKERS.run_thread(publish, "model", model.arrays(), SHARED_DATA_FOLDER)
+    print(f"Model retrained on {model.rating_count():,} ratings")
+
+@tasks.loop(minutes=SHARED_REFRESH_MINUTES)
+async def follow_shared_model():
+    """Map the model again when the retraining shard process has published a newer one"""
+    if SHARED_DATA_FOLDER is None or not DATASETS.is_loaded("model"):
+        return
+    generation = published_generation("model", SHARED_DATA_FOLDER)
+    if generation is None or generation == SHARED_GENERATIONS.get("model"):
+        return
+    # like retrain_model, an exception escaping the loop would stop it for good
+    try:
+        arrays = attach_shared("model")
+        if arrays is not None:
+            await WORKERS.run_thread(lambda: MODEL_SERVICE.attach(FactorModel(**arrays)))
+            RECOMMENDATION_CACHE.clear()
+    except Exception:
+        print("Could not map the republished model, keeping the current one:")
+        traceback.print_exc()
+
+def recommendation_latency():
+    """LatencyTrackers of !!rate fold-ins and of the !!recommend scoring modes, by name"""
+    trackers = {"fold_in": MODEL_SERVICE.fold_in_latency}
+    if HYBRID_RECOMMENDER is not None:
+        trackers.update(HYBRID_RECOMMENDER.latency)
+    return trackers
+
+async def run_search(key, movie_name):
+    lines = await WORKERS.run_thread(search_movies, movie_name)
+    SEARCH_RESULTS_CACHE.put(key, lines)
+    return lines
+
+async def fold_in_ratings(discord_id):
+    """Fold a user's stored ratings into the model, if the users and model datasets have loaded"""
+    if not DATASETS.ready("users", "model"):
+        # a model that loads later has no folded users, so !!recommend folds these ratings in on first use
+        return 0
+    user_id = DISCORD_USER_MAPPING.get(discord_id)
+    if user_id is None:
+        return 0
+    ratings = await RATING_STORE.user_ratings(discord_id)
+    return await WORKERS.run_thread(MODEL_SERVICE.fold_in, user_id, ratings)
+
+async def run_recommend(discord_id, n):
+    """(recommendations, mode, whether the user scored genres), computed and cached for one user"""
+    generation = RECOMMENDATION_CACHE.generation(discord_id)
+    user_id = DISCORD_USER_MAPPING.get(discord_id)
+    ratings = await RATING_STORE.user_ratings(discord_id)
+    preferences = await RATING_STORE.genres(discord_id)
+    model = MODEL_SERVICE.model
+    if user_id is not None and ratings and model is not None and user_id not in model.folded:
+        # ratings given before a restart, or through another shard process, are folded in on first use
+        await WORKERS.run_thread(MODEL_SERVICE.fold_in, user_id, ratings)
+    recommendations, mode = await WORKERS.run_thread(HYBRID_RECOMMENDER.recommend, user_id, ratings, preferences, n)
+    result = (recommendations, mode, bool(preferences))
+    RECOMMENDATION_CACHE.put(discord_id, "recommend", (n,), result, generation)
+    return result
 
 # Search command
 @commands.command(name="search", help="This command search movies in MOVIE_TITLE_MAPPING or vice versa  Usage: !!search <movie_name> or !!search <movie_title>")
 async def search(ctx, *, movie_name):
+    if not await ensure_datasets(ctx, "movies"):
+        return
 
-    await ctx.send(f"Searching for {movie_name}...")
-    movieid = ""
-    for movie in MOVIE_TITLE_MAPPING:
-        dataset_movie_name = MOVIE_TITLE_MAPPING[movie]
-        if str(movie_name).lower() in str(dataset_movie_name).lower():
-            movieid = str(movie)
-            await ctx.send(f"The Movie Title Mapping of: {dataset_movie_name} is {movieid}")
-        elif str(movie_name).lower() in str(movie).lower():
-            movieid = str(dataset_movie_name)
-            await ctx.send(f"The Movie Title of: {movie_name} is {movieid}")
+    # identical queries share one ranked result set, and every page comes from it
+    key = normalize_title(movie_name)
+    lines = SEARCH_RESULTS_CACHE.get(key)
+    if lines is None:
+        lines = await IN_FLIGHT.run(("search", key), run_search, key, movie_name)
+
+    if not lines:
+        suggestions = await IN_FLIGHT.run(("suggest", key), WORKERS.run_thread, suggest_movies, movie_name)
+        if suggestions:
+            titles = "\n".join(f"{MOVIE_TITLE_MAPPING[movie]} is {movie}" for movie in suggestions)
+            await ctx.send(f"No movies found for {movie_name}. Did you mean:\n{titles}")
+        else:
+            await ctx.send(f"No movies found for {movie_name}")
+        return
+    await send_paginated(ctx, f"Search results for {movie_name}", lines)
 
 @commands.command(name="rate", help="Send your rating as a number between 1 and 5.  You must put add decimal place of precision.")
-async def rate(ctx, movie_id, rating):
-    RATINGS_MAPPING[movie_id] = rating
-    await ctx.send(f"You rated: {movie_id} as a {rating}/5")
+async def rate(ctx, movie_id: int, rating: float):
+    if not await ensure_datasets(ctx, "movies"):
+        return
+    if movie_id not in MOVIE_TITLE_MAPPING:
+        await ctx.send(f"There is no movie with id {movie_id}, use !!search to find it")
+        return
+    if not MIN_RATING <= rating <= MAX_RATING:
+        await ctx.send(f"Ratings must be between {MIN_RATING:g} and {MAX_RATING:g}")
+        return
+
+    await RATING_STORE.add(ctx.author.id, movie_id, rating)
+    # results cached before this rating are stale from now on
+    RECOMMENDATION_CACHE.invalidate(ctx.author.id)
+    await ctx.send(f"You rated: {MOVIE_TITLE_MAPPING[movie_id]} as a {rating}/5")
+
+    try:
+        # fold the new rating into the user's vector so !!recommend reflects it right away
+        await fold_in_ratings(ctx.author.id)
+    finally:
+        # again once folded in: a !!recommend computed from the old vector must not be cached under the new generation
+        RECOMMENDATION_CACHE.invalidate(ctx.author.id)
+
+@commands.command(name="myratings", help="List the movies you have rated.  Usage: !!myratings")
+async def myratings(ctx):
+    if not await ensure_datasets(ctx, "movies"):
+        return
+
+    ratings = await RATING_STORE.user_ratings(ctx.author.id)
+    if not ratings:
+        await ctx.send("You have not rated any movies yet, use !!rate <movie_id> <rating>")
+        return
+    lines = [f"{MOVIE_TITLE_MAPPING.get(movie, f'Movie {movie}')}: {rating}/5" for movie, rating in ratings.items()]
+    await send_paginated(ctx, f"Ratings by {ctx.author.display_name}", lines)
+
+@commands.command(name="recommend", help="Recommend movies you have not rated yet.  Usage: !!recommend [number_of_movies]")
+async def recommend(ctx, n: int = 10):
+    # the model is not required: until it has loaded everyone gets genre based picks
+    if not await ensure_datasets(ctx, "users", "movies", "content"):
+        return
+
+    n = max(1, min(n, MAX_RECOMMENDATIONS))
+    cached = RECOMMENDATION_CACHE.get(ctx.author.id, "recommend", (n,))
+    if cached is None:
+        cached = await IN_FLIGHT.run(("recommend", ctx.author.id, n), run_recommend, ctx.author.id, n)
+    recommendations, mode, has_preferences = cached
+    lines = [f"{MOVIE_TITLE_MAPPING.get(movie, f'Movie {movie}')} ({score:.2f})" for movie, score in recommendations]
+    if not lines:
+        await ctx.send("I could not find any movies to recommend.")
+        return
+    if mode == "content" and not has_preferences:
+        await ctx.send("Tell me which genres you like with !!genres, or !!rate some movies, to get better picks.")
+    await send_paginated(ctx, f"Top {len(lines)} movies for {ctx.author.display_name}", lines)
+
+@commands.command(name="genres", help="Score genres from 1 (hate) to 5 (love) for recommendations.  Usage: !!genres Action=5 Comedy=2 ... or !!genres to list yours")
+async def genres(ctx, *scores):
+    if not scores:
+        preferences = await RATING_STORE.genres(ctx.author.id)
+        if not preferences:
+            await ctx.send(f"You have not scored any genres yet. Genres: {', '.join(GENRE_NAMES)}")
+            return
+        await ctx.send(", ".join(f"{genre}={score:g}" for genre, score in preferences.items()))
+        return
+
+    known = {genre.lower(): genre for genre in GENRE_NAMES}
+    preferences = {}
+    for item in scores:
+        genre, _, score = item.partition("=")
+        try:
+            score = float(score)
+        except ValueError:
+            score = None
+        if genre.lower() not in known or score is None or not MIN_GENRE_SCORE <= score <= MAX_GENRE_SCORE:
+            await ctx.send(f"Could not read {item}, use Genre=score with a score from {MIN_GENRE_SCORE} to "
+                           f"{MAX_GENRE_SCORE}. Genres: {', '.join(GENRE_NAMES)}")
+            return
+        preferences[known[genre.lower()]] = score
+
+    await RATING_STORE.set_genres(ctx.author.id, preferences)
+    RECOMMENDATION_CACHE.invalidate(ctx.author.id)
+    await ctx.send(f"Saved your scores for {len(preferences)} genres, try !!recommend")
+
+@commands.command(name="similar", help="List movies similar to a movie.  Usage: !!similar <movie_title> or !!similar <movie_id>")
+async def similar(ctx, *, movie_name):
+    if not await ensure_datasets(ctx, "movies", "similarity"):
+        return
+
+    movie = resolve_movie(movie_name)
+    if movie is None or movie not in SIMILARITY_INDEX.id_index:
+        await ctx.send(f"No movies found for {movie_name}")
+        return
 
+    matches = await IN_FLIGHT.run(("similar", movie), WORKERS.run_thread, SIMILARITY_INDEX.similar, movie,
+                                  SIMILAR_RESULTS, SIMILAR_PROBES)
+    lines = [f"{MOVIE_TITLE_MAPPING.get(other, f'Movie {other}')} ({similarity:.2f})" for other, similarity in matches]
+    if not lines:
+        await ctx.send(f"I could not find any movies like {MOVIE_TITLE_MAPPING[movie]}")
+        return
+    await send_paginated(ctx, f"Movies like {MOVIE_TITLE_MAPPING[movie]}", lines)
 
+@commands.command(name="register", help="Register yourself so your ratings can be used for recommendations.  Usage: !!register [age]")
+async def register(ctx, age: int = 0):
+    if not await ensure_datasets(ctx, "users"):
+        return
 
+    # appending to the log takes a file lock and an fsync, which must not block the event loop
+    user_id, created = await WORKERS.run_thread(USER_REGISTRY.register, ctx.author.id, ctx.author.name, age)
+    if created:
+        # their ratings now reach the model through the new user id
+        RECOMMENDATION_CACHE.invalidate(ctx.author.id)
+        await ctx.send(f"Welcome {ctx.author.display_name}! You are registered as user {user_id}.")
+    else:
+        await ctx.send(f"You are already registered as user {user_id}.")
@@ -0,0 +1,82 @@
+import numpy as np
+
+# Users scored per matrix product in top_n_batch; bounds the users x items score block
+BATCH_SIZE = 1024
+
+
+def top_n(scores, n, exclude=None):
+    """Indices of the n highest scores, best first, skipping positions where exclude is True.
+
+    argpartition finds the n best in linear time and only those n are sorted,
+    instead of sorting every score.
+    """
+    if exclude is not None:
+        scores = np.where(exclude, -np.inf, scores)
+    n = min(n, len(scores))
+    if n <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    best = np.argpartition(-scores, n - 1)[:n] if n < len(scores) else np.arange(len(scores))
+    best = best[np.argsort(-scores[best], kind="stable")]
+    return best[np.isfinite(scores[best])]
+
+
+def score_items(user_vector, user_bias, item_factors, item_bias, global_mean, rating_scale=None):
+    """Predicted rating of every item for one user as a single matrix-vector product"""
+    scores = item_factors @ user_vector + (global_mean + user_bias) + item_bias
+    if rating_scale is not None:
+        np.clip(scores, *rating_scale, out=scores)
+    return scores
+
+
+def exclusion_mask(indptr, indices, n_items, rows=None):
+    """Boolean users x items mask from rated items in CSR form, for the given CSR rows"""
+    rows = np.arange(len(indptr) - 1) if rows is None else np.asarray(rows)
+    counts = indptr[rows + 1] - indptr[rows]
+    mask = np.zeros((len(rows), n_items), dtype=bool)
+    if counts.sum():
+        columns = np.concatenate([indices[indptr[row]:indptr[row + 1]] for row in rows.tolist()])
+        mask[np.repeat(np.arange(len(rows)), counts), columns] = True
+    return mask
+
+
+def top_n_batch(user_vectors, user_biases, item_factors, item_bias, global_mean, n, rating_scale=None,
+                exclude=None, batch_size=BATCH_SIZE):
+    """Top n item indices and scores for many users at once.
+
+    Users are scored BATCH_SIZE at a time with one matrix product each.
+    exclude, if given, is a function taking a slice of user rows and
+    returning the boolean mask of items to leave out for those users.
+    Returns (indices, scores) arrays of shape (users, n); rows with fewer
+    than n eligible items are padded with -1 and -inf.
+    """
+    n_users, n_items = len(user_vectors), len(item_factors)
+    n = min(n, n_items)
+    indices = np.full((n_users, n), -1, dtype=np.int64)
+    top_scores = np.full((n_users, n), -np.inf, dtype=np.float32)
+    if n <= 0:
+        return indices, top_scores
+
+    for start in range(0, n_users, batch_size):
+        rows = slice(start, min(start + batch_size, n_users))
+        scores = user_vectors[rows] @ item_factors.T
+        scores += (global_mean + user_biases[rows])[:, None]
+        scores += item_bias[None, :]
+        if rating_scale is not None:
+            np.clip(scores, *rating_scale, out=scores)
+        if exclude is not None:
+            scores[exclude(rows)] = -np.inf
+
+        if n < n_items:
+            best = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+        else:
+            best = np.tile(np.arange(n_items), (scores.shape[0], 1))
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        best = np.take_along_axis(best, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+
+        best[~np.isfinite(best_scores)] = -1
+        indices[rows] = best
+        top_scores[rows] = best_scores
+    return indices, top_scores
@@ -0,0 +1,93 @@
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from dataset_loader import DATASET_FOLDER
+from snapshot import load_array
+
+# Where the loader process publishes the arrays that every shard process maps
+SHARED_FOLDER = f"{DATASET_FOLDER}/.shared"
+# Times attach() re-reads a manifest that was replaced while it was opening the files
+ATTACH_ATTEMPTS = 3
+
+
+def manifest_path(name, folder=SHARED_FOLDER):
+    return f"{folder}/{name}.json"
+
+
+def publish(name, arrays, folder=SHARED_FOLDER):
+    """Write arrays as .npy files into a new generation folder and point the name's manifest at it.
+
+    The manifest is replaced atomically, so readers see either the old or the
+    new generation, never a mix. Older generations are removed afterwards;
+    processes that still map their files keep them until they let go, as
+    deleted files stay readable while open. Returns the new generation.
+    """
+    generation = time.time_ns()
+    target = f"{folder}/{name}-{generation}"
+    os.makedirs(target)
+    for key, value in arrays.items():
+        np.save(f"{target}/{key}.npy", np.asarray(value), allow_pickle=False)
+
+    manifest = {"generation": generation, "folder": os.path.basename(target), "arrays": sorted(arrays)}
+    temporary = f"{manifest_path(name, folder)}.tmp"
+    with open(temporary, "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(temporary, manifest_path(name, folder))
+
+    for entry in os.listdir(folder):
+        if entry.startswith(f"{name}-") and entry != manifest["folder"]:
+            shutil.rmtree(f"{folder}/{entry}", ignore_errors=True)
+    return generation
+
+
+def read_manifest(name, folder=SHARED_FOLDER):
+    try:
+        with open(manifest_path(name, folder)) as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+
+
+def published_generation(name, folder=SHARED_FOLDER):
+    """Generation of the name's latest publication, or None"""
+    manifest = read_manifest(name, folder)
+    return None if manifest is None else manifest["generation"]
+
+
+def attach(name, folder=SHARED_FOLDER):
+    """(generation, {key: read-only memory mapped array}) of the latest publication, or None.
+
+    The arrays are backed by the page cache, so every process attaching the
+    same generation shares one copy of the data.
+    """
+    for _ in range(ATTACH_ATTEMPTS):
+        manifest = read_manifest(name, folder)
+        if manifest is None:
+            return None
+        try:
+            arrays = {key: load_array(f"{folder}/{manifest['folder']}/{key}.npy") for key in manifest["arrays"]}
+        except FileNotFoundError:
+            # a newer generation replaced this one while we were opening it
+            continue
+        return manifest["generation"], arrays
+    return None
+
+
+def withdraw(name, folder=SHARED_FOLDER):
+    """Remove the name's manifest and generations, so attach() finds nothing for it"""
+    try:
+        os.remove(manifest_path(name, folder))
+    except FileNotFoundError:
+        pass
+    if os.path.isdir(folder):
+        for entry in os.listdir(folder):
+            if entry.startswith(f"{name}-"):
+                shutil.rmtree(f"{folder}/{entry}", ignore_errors=True)
+
+
+def clear(folder=SHARED_FOLDER):
+    shutil.rmtree(folder, ignore_errors=True)
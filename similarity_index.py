@@ -0,0 +1,90 @@
+import numpy as np
+
+from scoring import top_n
+
+# Default shape of the index: more tables raise recall, more bits make buckets smaller and queries faster
+N_TABLES = 8
+N_BITS = 10
+
+
+def normalize_rows(vectors):
+    """Scale each row to unit length so dot products are cosine similarities; zero rows stay zero"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+class SimilarityIndex:
+    """Random-projection LSH index for cosine "items like X" lookups.
+
+    Each of n_tables tables hashes an item to the sign pattern of its vector
+    against n_bits random hyperplanes, so similar items tend to share a
+    bucket. A query gathers the items in its bucket from every table (plus
+    up to `probes` neighbouring buckets per table, found by flipping the
+    least certain bits) and ranks only those candidates exactly. Raising
+    n_tables or probes trades latency for recall.
+    """
+
+    def __init__(self, ids, vectors, n_tables=N_TABLES, n_bits=N_BITS, seed=42):
+        self.ids = np.asarray(ids)
+        self.vectors = normalize_rows(vectors)
+        self.id_index = {item: row for row, item in enumerate(self.ids.tolist())}
+        self.n_bits = n_bits
+
+        rng = np.random.default_rng(seed)
+        self.planes = rng.standard_normal((n_tables, n_bits, self.vectors.shape[1])).astype(np.float32)
+        self.bit_weights = (1 << np.arange(n_bits)).astype(np.int64)
+
+        # every table keeps its rows sorted by bucket key plus the key range of each bucket
+        self.tables = []
+        for planes in self.planes:
+            keys = ((self.vectors @ planes.T) > 0).astype(np.int64) @ self.bit_weights
+            order = np.argsort(keys, kind="stable")
+            bucket_keys, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+            self.tables.append((bucket_keys, starts, starts + counts, order))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _bucket(self, table, key):
+        bucket_keys, starts, ends, order = table
+        position = np.searchsorted(bucket_keys, key)
+        if position < len(bucket_keys) and bucket_keys[position] == key:
+            return order[starts[position]:ends[position]]
+        return order[:0]
+
+    def candidates(self, vector, probes=0):
+        """Rows sharing a bucket with vector in any table"""
+        found = []
+        for planes, table in zip(self.planes, self.tables):
+            projections = planes @ vector
+            key = int((projections > 0).astype(np.int64) @ self.bit_weights)
+            found.append(self._bucket(table, key))
+            # multi-probe: also visit the buckets one flipped bit away, least certain bits first
+            for bit in np.argsort(np.abs(projections))[:probes].tolist():
+                found.append(self._bucket(table, key ^ (1 << bit)))
+        return np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
+
+    def query(self, vector, k=10, probes=0, exclude_row=None):
+        """Approximate top k (id, cosine similarity) pairs for a vector"""
+        vector = normalize_rows(np.asarray(vector)[None, :])[0]
+        rows = self.candidates(vector, probes)
+        if exclude_row is not None:
+            rows = rows[rows != exclude_row]
+        similarities = self.vectors[rows] @ vector
+        best = top_n(similarities, k)
+        return list(zip(self.ids[rows[best]].tolist(), similarities[best].tolist()))
+
+    def similar(self, item_id, k=10, probes=0):
+        """Approximate top k items like item_id, leaving out the item itself"""
+        row = self.id_index[item_id]
+        return self.query(self.vectors[row], k, probes, exclude_row=row)
+
+    def brute_force(self, item_id, k=10):
+        """Exact top k items like item_id, for measuring recall"""
+        row = self.id_index[item_id]
+        similarities = self.vectors @ self.vectors[row]
+        exclude = np.zeros(len(similarities), dtype=bool)
+        exclude[row] = True
+        best = top_n(similarities, k, exclude)
+        return list(zip(self.ids[best].tolist(), similarities[best].tolist()))
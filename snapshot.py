@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from dataset_loader import DATASET_FOLDER
+
+SNAPSHOT_FOLDER = f"{DATASET_FOLDER}/.snapshot"
+MANIFEST_NAME = "manifest.json"
+# Bump when the on-disk layout changes so old snapshots are rebuilt
+SNAPSHOT_VERSION = 3
+# Also compare a content hash of the source file, not only its size and mtime
+VERIFY_HASH = False
+
+
+def file_hash(file_path, block_size=1 << 20):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as source_file:
+        for block in iter(lambda: source_file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_fingerprint(file_path):
+    """Size, mtime and (optionally) content hash identifying one version of a source file"""
+    stat = os.stat(file_path)
+    fingerprint = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if VERIFY_HASH:
+        fingerprint["hash"] = file_hash(file_path)
+    return fingerprint
+
+
+def encode_text(values):
+    """Pack strings into one UTF-8 byte buffer plus an offsets array; missing values become empty strings"""
+    encoded = [b"" if pd.isna(value) else str(value).encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def decode_text(buffer, offsets):
+    data = buffer.tobytes()
+    bounds = offsets.tolist()
+    if data.isascii():
+        # byte offsets are character offsets, so decode once and slice the string
+        data = data.decode("ascii")
+        return [data[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+    return [data[start:end].decode("utf-8") for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def load_array(file_path):
+    try:
+        return np.load(file_path, mmap_mode="r")
+    except ValueError:
+        # empty arrays cannot be memory mapped
+        return np.load(file_path)
+
+
+def table_folder(name):
+    return f"{SNAPSHOT_FOLDER}/{name}"
+
+
+def save_table(name, df, source_path):
+    """Write every column of df as .npy files, then the manifest that marks the snapshot valid"""
+    folder = table_folder(name)
+    os.makedirs(folder, exist_ok=True)
+    # a half written snapshot must never look valid
+    manifest_path = f"{folder}/{MANIFEST_NAME}"
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    columns = []
+    for position, column in enumerate(df.columns):
+        series = df[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # categories are stored once, rows only keep their integer codes
+            np.save(f"{folder}/{position}.npy", series.cat.codes.to_numpy())
+            buffer, offsets = encode_text(series.cat.categories.tolist())
+            kind = "category"
+        elif pd.api.types.is_numeric_dtype(series):
+            np.save(f"{folder}/{position}.npy", series.to_numpy())
+            kind = "numeric"
+        else:
+            buffer, offsets = encode_text(series.tolist())
+            kind = "text"
+        if kind != "numeric":
+            np.save(f"{folder}/{position}.data.npy", buffer)
+            np.save(f"{folder}/{position}.offsets.npy", offsets)
+        entry = {"name": column, "kind": kind}
+        if kind == "text" and series.isna().any():
+            # encode_text writes missing values as "", the mask tells them apart from real empty strings
+            np.save(f"{folder}/{position}.nulls.npy", series.isna().to_numpy())
+            entry["nulls"] = True
+        columns.append(entry)
+
+    manifest = {"version": SNAPSHOT_VERSION, "source": source_fingerprint(source_path), "columns": columns}
+    with open(manifest_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+
+
+def load_table(name, source_path):
+    """Return the snapshot of a table as a DataFrame, or None if it is missing or stale"""
+    folder = table_folder(name)
+    try:
+        with open(f"{folder}/{MANIFEST_NAME}") as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != SNAPSHOT_VERSION or manifest.get("source") != source_fingerprint(source_path):
+        return None
+
+    data = {}
+    for position, column in enumerate(manifest["columns"]):
+        if column["kind"] != "numeric":
+            values = decode_text(load_array(f"{folder}/{position}.data.npy"),
+                                 load_array(f"{folder}/{position}.offsets.npy"))
+        if column["kind"] == "numeric":
+            data[column["name"]] = load_array(f"{folder}/{position}.npy")
+        elif column["kind"] == "category":
+            data[column["name"]] = pd.Categorical.from_codes(load_array(f"{folder}/{position}.npy"), values)
+        else:
+            if column.get("nulls"):
+                nulls = load_array(f"{folder}/{position}.nulls.npy")
+                values = [np.nan if missing else value for value, missing in zip(values, nulls.tolist())]
+            data[column["name"]] = values
+    return pd.DataFrame(data, copy=False)
+
+
+def cached_read(name, source_path, reader):
+    """Load a table from its snapshot, re-reading source_path with reader when the snapshot is stale"""
+    df = load_table(name, source_path)
+    if df is not None:
+        return df
+
+    df = reader(source_path)
+    try:
+        save_table(name, df, source_path)
+    except OSError as error:
+        print(f"Could not write snapshot {name}: {error}")
+    return df
+
+
+def clear_snapshots():
+    shutil.rmtree(SNAPSHOT_FOLDER, ignore_errors=True)
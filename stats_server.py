@@ -0,0 +1,24 @@
+from aiohttp import web
+
+# The endpoint only listens locally; point a Prometheus scraper on the same host at it
+STATS_HOST = "127.0.0.1"
+STATS_PORT = 9108
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+async def start_stats_server(render, host=STATS_HOST, port=STATS_PORT):
+    """Serve render() (Prometheus text lines) at http://host:port/metrics; returns the runner to clean up"""
+    async def metrics(request):
+        return web.Response(body="\n".join(render()) + "\n", headers={"Content-Type": PROMETHEUS_CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError:
+        await runner.cleanup()
+        raise
+    print(f"Serving metrics at http://{host}:{port}/metrics")
+    return runner
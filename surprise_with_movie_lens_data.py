@@ -3,42 +3,31 @@
 # surprise: A Python library specifically designed for building and analyzing recommendation systems
 from surprise import Dataset, Reader, SVD, accuracy
 from surprise.model_selection import train_test_split
-import pandas as pd
+
+from dataset_loader import measure_load, movie_title_mapping as build_movie_title_mapping, read_movies_csv
+from ratings_stream import RatingsSummary, sample_ratings, to_surprise_frame
 
 DATASET_FOLDER = "ml-from-2015"
 print(f"Loading MovieLens data from {DATASET_FOLDER}")
 
 ratings_filepath = f"{DATASET_FOLDER}/ratings.csv"
 
-# Read the ratings data
+# Stream the ratings file and keep a random sample of DATA_COUNT ratings
+# Only the sample is held in memory, the statistics are gathered chunk by chunk
+DATA_COUNT = 1000
 print("Loading ratings data...")
-df_ratings = pd.read_csv(ratings_filepath)
-print(f"Shape of dataset: {df_ratings.shape}")
-# print(df_ratings.info())
-print(df_ratings.head())
+summary = RatingsSummary()
+df_ratings = measure_load("ratings.csv", sample_ratings, ratings_filepath, DATA_COUNT, seed=42, summary=summary)
 
 # Display basic statistics about the dataset
-print(f"Number of unique users: {df_ratings['userId'].nunique():,}")
-print(f"Number of unique movies: {df_ratings['movieId'].nunique():,}")
-print(f"Rating range: {df_ratings['rating'].min()} to {df_ratings['rating'].max()}")
-print(f"Average rating: {df_ratings['rating'].mean():.2f}")
-
-DATA_COUNT = 1000
-DATA_FRACTION = DATA_COUNT/df_ratings.shape[0]
-# Sample a fraction of the data if specified
-if DATA_FRACTION < 1.0:
-    df_ratings = df_ratings.sample(frac=DATA_FRACTION, random_state=42).reset_index(drop=True)
-    print(f"Using {len(df_ratings):,} ratings ({DATA_FRACTION * 100:.5f}% of total)")
+summary.print_report()
+print(f"Using {len(df_ratings):,} ratings ({len(df_ratings) / max(summary.rows, 1) * 100:.5f}% of total)")
+print(df_ratings.head())
 
 
 # Rename columns to match Surprise expectations
 # Surprise expects: userID, itemID, rating
-data_for_surprise = df_ratings.rename(columns={
-    'userId': 'userID',
-    'movieId': 'itemID'
-})
-# print(data_for_surprise.head())
-data_for_surprise = data_for_surprise[['userID', 'itemID', 'rating']]
+data_for_surprise = to_surprise_frame(df_ratings)
 
 print("\nData preparation complete!")
 print(f"Final dataset shape: {data_for_surprise.shape}")
@@ -94,11 +83,11 @@ print("(Lower RMSE means better predictions)")\
 
 
 movies_filepath = f"{DATASET_FOLDER}/movies.csv"
-df_movies = pd.read_csv(movies_filepath)
+df_movies = measure_load("movies.csv", read_movies_csv, movies_filepath)
 print(f"Movie database contains {len(df_movies):,} movies")
 
 # Create a mapping from movieId to title for later use
-movie_title_mapping = dict(zip(df_movies['movieId'], df_movies['title']))
+movie_title_mapping = build_movie_title_mapping(df_movies, id_column="movieId")
 
 # EXAMINING INDIVIDUAL PREDICTIONS
 # Let's look at some specific predictions to understand what the model is doing
@@ -0,0 +1,152 @@
+import asyncio
+import functools
+import time
+
+from discord.ext import commands
+
+# Commands that cost real CPU or several Discord calls; everything else is never throttled
+THROTTLED_COMMANDS = {"search", "recommend", "similar", "myratings", "rate"}
+# Each member may burst this many throttled commands, then gets one more every 1 / rate seconds
+USER_RATE = 0.5
+USER_BURST = 5
+# The same for a whole guild, so a busy server cannot take the bot's entire Discord API budget
+GUILD_RATE = 5.0
+GUILD_BURST = 30
+# Idle (full) buckets are dropped once there are this many, to keep memory bounded
+MAX_BUCKETS = 10_000
+
+
+class SingleFlight:
+    """Shares one in-flight computation among identical concurrent requests.
+
+    The first caller for a key starts the work as a task; callers arriving
+    with the same key before it finishes await that task instead of
+    starting their own, and all of them get its result or its exception.
+    Nothing is kept once it finishes, so this only merges overlapping
+    requests; caching finished results is the job of the caches.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def run(self, key, function, *args):
+        """Await function(*args) (a coroutine function), or the identical call already running for key"""
+        task = self.calls.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(function(*args))
+            self.calls[key] = task
+            task.add_done_callback(functools.partial(self.finish, key))
+        else:
+            self.followers += 1
+        # a caller that gives up (say its command is cancelled) must not cancel the others' work
+        return await asyncio.shield(task)
+
+    def finish(self, key, task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+
+    def stats(self):
+        return {"in_flight": len(self.calls), "leaders": self.leaders, "followers": self.followers}
+
+
+class TokenBucket:
+    """Holds up to `burst` tokens and gains `rate` tokens per second"""
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.updated = clock()
+        # set once the owner has been told to slow down, cleared by their next accepted command
+        self.warned = False
+
+    def refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """Seconds until a token is available, 0 if one is available now"""
+        self.refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def full(self):
+        self.refill()
+        return self.tokens >= self.burst
+
+
+class Throttled(commands.CheckFailure):
+    """Raised by CommandThrottle.check when the member or their guild is out of tokens"""
+
+    def __init__(self, scope, retry_after, notify):
+        super().__init__(f"{scope} is sending commands too quickly, retry in {retry_after:.1f}s")
+        self.scope = scope
+        self.retry_after = retry_after
+        # only the first refusal in a row is worth a reply, the rest are dropped silently
+        self.notify = notify
+
+
+class CommandThrottle:
+    """Token bucket rate limit per member and per guild, used as a global bot check.
+
+    A throttled command needs a token from both the member's bucket and
+    their guild's (direct messages only use the member's), and takes them
+    only when both have one, so a refusal by the guild costs the member
+    nothing.
+    """
+
+    def __init__(self, user_rate=USER_RATE, user_burst=USER_BURST, guild_rate=GUILD_RATE, guild_burst=GUILD_BURST,
+                 throttled_commands=THROTTLED_COMMANDS, clock=time.monotonic):
+        self.limits = {"user": (user_rate, user_burst), "guild": (guild_rate, guild_burst)}
+        self.throttled_commands = set(throttled_commands)
+        self.clock = clock
+        self.buckets = {"user": {}, "guild": {}}
+        self.rejected = {"user": 0, "guild": 0}
+
+    def bucket(self, scope, key):
+        buckets = self.buckets[scope]
+        bucket = buckets.get(key)
+        if bucket is None:
+            if len(buckets) >= MAX_BUCKETS:
+                self.prune(scope)
+            bucket = buckets[key] = TokenBucket(*self.limits[scope], clock=self.clock)
+        return bucket
+
+    def prune(self, scope):
+        """Forget buckets that have refilled completely; a new one starts full anyway"""
+        buckets = self.buckets[scope]
+        for key in [key for key, bucket in buckets.items() if bucket.full()]:
+            del buckets[key]
+
+    async def check(self, ctx):
+        if ctx.command is None or ctx.command.qualified_name not in self.throttled_commands:
+            return True
+        scopes = [("user", ctx.author.id)]
+        if ctx.guild is not None:
+            scopes.append(("guild", ctx.guild.id))
+        buckets = [(scope, self.bucket(scope, key)) for scope, key in scopes]
+        # the member's bucket remembers the warning, so pruning forgets it along with the bucket
+        member = buckets[0][1]
+
+        for scope, bucket in buckets:
+            wait = bucket.wait_time()
+            if wait > 0:
+                self.rejected[scope] += 1
+                notify = not member.warned
+                member.warned = True
+                raise Throttled(scope, wait, notify)
+        for scope, bucket in buckets:
+            bucket.take()
+        member.warned = False
+        return True
+
+    def stats(self):
+        return {"rejected_user": self.rejected["user"], "rejected_guild": self.rejected["guild"],
+                "buckets": sum(len(buckets) for buckets in self.buckets.values())}
@@ -0,0 +1,86 @@
+import heapq
+import unicodedata
+
+# Length of the character n-grams stored in the postings lists
+GRAM_SIZE = 3
+
+
+def normalize_title(text):
+    """Lowercase a title, strip accents and collapse repeated whitespace"""
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(text.lower().split())
+
+
+def title_grams(text):
+    """Return the set of GRAM_SIZE character n-grams of a normalized title"""
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+class TitleIndex:
+    """Trigram index over movie titles for fast substring lookup.
+
+    The index is built once from a {movie_id: title} mapping. A query is
+    answered by intersecting the postings of its trigrams (smallest list
+    first) and verifying the surviving candidates with a real substring
+    check, so the cost depends on the number of candidates rather than on
+    the size of the catalog.
+    """
+
+    def __init__(self, titles):
+        # Titles are stored shortest first so a lower position also means a shorter title
+        entries = sorted(((normalize_title(title), key) for key, title in titles.items()), key=lambda entry: len(entry[0]))
+        self.keys = [key for text, key in entries]
+        self.texts = [text for text, key in entries]
+        self.postings = {}
+        for position, text in enumerate(self.texts):
+            for gram in title_grams(text):
+                self.postings.setdefault(gram, []).append(position)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _candidates(self, query):
+        # Queries shorter than a trigram cannot use the postings, check every title
+        if len(query) < GRAM_SIZE:
+            return range(len(self.texts))
+
+        postings = sorted((self.postings.get(gram, []) for gram in title_grams(query)), key=len)
+        if len(postings) == 1:
+            return postings[0]
+        candidates = set(postings[0])
+        for positions in postings[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(positions)
+        return candidates
+
+    def _rank(self, query, position):
+        text = self.texts[position]
+        if text == query:
+            return 0, position
+        if text.startswith(query):
+            return 1, position
+        if f" {query}" in text:
+            return 2, position
+        return 3, position
+
+    def search(self, query, limit=None):
+        """Return the keys whose title contains query, best matches first.
+
+        Exact matches rank first, then prefix matches, then matches at the
+        start of a word, then any other substring match. Ties go to the
+        shorter title.
+        """
+        query = normalize_title(query)
+        if not query:
+            return []
+
+        texts = self.texts
+        matches = [position for position in self._candidates(query) if query in texts[position]]
+        rank = lambda position: self._rank(query, position)
+        if limit is None:
+            matches.sort(key=rank)
+        else:
+            matches = heapq.nsmallest(limit, matches, key=rank)
+        return [self.keys[position] for position in matches]
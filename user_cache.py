@@ -0,0 +1,94 @@
+import time
+from collections import OrderedDict
+
+# Number of results kept before the least recently used one is dropped
+USER_CACHE_SIZE = 1024
+# Seconds a result is served from the cache before it is computed again
+USER_CACHE_TTL = 600
+
+
+class UserResultCache:
+    """Least recently used cache of command results per Discord user, with an expiry time.
+
+    Keys are (discord user id, command, args). Besides size based eviction
+    and the TTL, invalidate(user) drops every result of one user, which is
+    what a change to that user's ratings or genres has to do. The counters
+    are there to size the cache: a high expiration count means the TTL is
+    too short, a high eviction count that max_size is too small.
+
+    A result computed while the user's data changed must not be stored:
+    read generation(user) before computing and pass it to put(), which
+    skips the value when an invalidate() or clear() happened in between.
+    """
+
+    def __init__(self, max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        # key -> (expires at, value)
+        self.entries = OrderedDict()
+        # user -> keys cached for them, so invalidate() does not scan every entry
+        self.user_keys = {}
+        # user -> number of invalidations, only for users invalidated at least once
+        self.generations = {}
+        # number of clear() calls, which invalidate everyone at once
+        self.epoch = 0
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, user, command, args=()):
+        """The cached value, or None when it is missing or expired"""
+        key = (user, command, args)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0] <= self.clock():
+            self.remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def generation(self, user):
+        return self.epoch, self.generations.get(user, 0)
+
+    def put(self, user, command, args, value, generation=None):
+        if generation is not None and generation != self.generation(user):
+            return
+        key = (user, command, args)
+        self.entries[key] = (self.clock() + self.ttl, value)
+        self.entries.move_to_end(key)
+        self.user_keys.setdefault(user, set()).add(key)
+        while len(self.entries) > self.max_size:
+            self.remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def remove(self, key):
+        del self.entries[key]
+        keys = self.user_keys[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self.user_keys[key[0]]
+
+    def invalidate(self, user):
+        """Drop every cached result of one user"""
+        self.generations[user] = self.generations.get(user, 0) + 1
+        for key in self.user_keys.pop(user, ()):
+            del self.entries[key]
+            self.invalidations += 1
+
+    def clear(self):
+        self.epoch += 1
+        self.entries.clear()
+        self.user_keys.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "expirations": self.expirations, "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
@@ -0,0 +1,134 @@
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows has no fcntl; registration is then only safe within one process
+    fcntl = None
+
+from dataset_loader import DATASET_FOLDER
+
+USERS_FILE = f"{DATASET_FOLDER}/u.user"
+# Registrations since the last compaction, one u.user formatted row per line
+USER_LOG_FILE = f"{DATASET_FOLDER}/u.user.log"
+DISCORD_GENDER = "D"
+
+
+def clean_field(value):
+    """Make a value safe to store in a pipe separated row"""
+    return " ".join(str(value).replace("|", " ").split())
+
+
+class UserRegistry:
+    """Allocates dataset user ids to Discord members without rewriting u.user.
+
+    New users are appended as gender "D" rows to USER_LOG_FILE and added to
+    the shared DISCORD_USER_MAPPING dict in place. Allocation holds a thread
+    lock and an exclusive lock on the log file, and first replays any rows
+    other processes appended, so ids stay unique across concurrent commands
+    and bot processes. compact() moves the log into u.user and the users
+    snapshot.
+    """
+
+    def __init__(self, mapping, log_path=USER_LOG_FILE):
+        self.mapping = mapping
+        self.log_path = log_path
+        self.next_id = 1
+        self.log_offset = 0
+        self.lock = threading.Lock()
+
+    def reset(self, next_id):
+        """Start allocating after the ids already in u.user, then apply the log"""
+        with self.lock:
+            self.next_id = next_id
+            self.log_offset = 0
+            with open(self.log_path, "a+", encoding="utf-8") as log_file:
+                self._lock_file(log_file)
+                try:
+                    self._replay(log_file)
+                finally:
+                    self._unlock_file(log_file)
+
+    def _lock_file(self, log_file):
+        if fcntl is not None:
+            fcntl.flock(log_file, fcntl.LOCK_EX)
+
+    def _unlock_file(self, log_file):
+        if fcntl is not None:
+            fcntl.flock(log_file, fcntl.LOCK_UN)
+
+    def _replay(self, log_file):
+        """Apply log rows appended since we last read the file"""
+        log_file.seek(self.log_offset)
+        for line in log_file:
+            fields = line.rstrip("\n").split("|")
+            if len(fields) != 5 or fields[2] != DISCORD_GENDER:
+                continue
+            user_id, discord_id = int(fields[0]), int(fields[4])
+            self.mapping.setdefault(discord_id, user_id)
+            self.next_id = max(self.next_id, user_id + 1)
+        self.log_offset = log_file.tell()
+
+    def register(self, discord_id, username, age=0):
+        """Return (user_id, created) for a Discord member, allocating a new id if needed"""
+        discord_id = int(discord_id)
+        with self.lock:
+            if discord_id in self.mapping:
+                return self.mapping[discord_id], False
+
+            with open(self.log_path, "a+", encoding="utf-8") as log_file:
+                self._lock_file(log_file)
+                try:
+                    self._replay(log_file)
+                    if discord_id in self.mapping:
+                        return self.mapping[discord_id], False
+
+                    user_id = self.next_id
+                    log_file.write(f"{user_id}|{int(age)}|{DISCORD_GENDER}|{clean_field(username)}|{discord_id}\n")
+                    log_file.flush()
+                    os.fsync(log_file.fileno())
+                    self.log_offset = log_file.tell()
+                finally:
+                    self._unlock_file(log_file)
+
+            self.next_id = user_id + 1
+            self.mapping[discord_id] = user_id
+            return user_id, True
+
+    def compact(self, users_path=USERS_FILE, rebuild_snapshot=None):
+        """Append the logged rows to u.user, rebuild its snapshot and empty the log.
+
+        u.user is only appended to, never rewritten. If the process dies
+        between the append and emptying the log, the rows are replayed again
+        on the next start and skipped because their Discord ids are known.
+        Returns the number of rows moved.
+        """
+        with self.lock:
+            if not os.path.exists(self.log_path):
+                return 0
+            with open(self.log_path, "r+", encoding="utf-8") as log_file:
+                self._lock_file(log_file)
+                try:
+                    rows = log_file.read()
+                    if not rows:
+                        return 0
+                    with open(users_path, "rb+") as users_file:
+                        # u.user may not end with a newline
+                        users_file.seek(0, os.SEEK_END)
+                        if users_file.tell():
+                            users_file.seek(-1, os.SEEK_END)
+                            prefix = b"" if users_file.read(1) == b"\n" else b"\n"
+                        else:
+                            prefix = b""
+                        users_file.write(prefix + rows.encode("utf-8"))
+                        users_file.flush()
+                        os.fsync(users_file.fileno())
+                    log_file.seek(0)
+                    log_file.truncate()
+                    self.log_offset = 0
+                finally:
+                    self._unlock_file(log_file)
+
+        if rebuild_snapshot is not None:
+            rebuild_snapshot()
+        return rows.count("\n")
@@ -0,0 +1,135 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from metrics import LatencyTracker
+
+# Jobs of one kind allowed to wait or run at once before new ones are turned away
+MAX_PENDING_JOBS = 32
+# Seconds a command waits for its job before giving up
+JOB_TIMEOUT = 30
+# Seconds between event loop lag measurements
+LAG_INTERVAL = 0.5
+
+
+class WorkerBusyError(Exception):
+    """Raised when a pool already has MAX_PENDING_JOBS jobs queued or running"""
+
+
+class WorkerPool:
+    """Runs CPU-bound work off the event loop.
+
+    The thread pool suits NumPy and pandas work that releases the GIL; the
+    process pool suits pure-Python loops and Surprise training that would
+    otherwise hold it. Each pool accepts at most max_pending jobs at a time
+    and every job is awaited with a timeout. A timed-out job is abandoned by
+    the caller but keeps running in its worker until it finishes, and holds
+    its pending slot until then, so max_pending bounds the real load.
+    """
+
+    def __init__(self, thread_workers=None, process_workers=None, max_pending=MAX_PENDING_JOBS, timeout=JOB_TIMEOUT):
+        self.thread_workers = thread_workers or min(8, (os.cpu_count() or 1) + 2)
+        self.process_workers = process_workers or max(1, (os.cpu_count() or 2) - 1)
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.thread_pool = None
+        self.process_pool = None
+        self.pending = {"thread": 0, "process": 0}
+        self.completed = {"thread": 0, "process": 0}
+        self.failed = {"thread": 0, "process": 0}
+        self.rejected = {"thread": 0, "process": 0}
+        self.timeouts = {"thread": 0, "process": 0}
+        self.latency = {"thread": LatencyTracker(), "process": LatencyTracker()}
+        # jobs end in worker threads, which release their slot under this lock
+        self.pending_lock = threading.Lock()
+
+    def executor(self, kind):
+        # pools start on first use so importing this module costs nothing
+        if kind == "thread":
+            if self.thread_pool is None:
+                self.thread_pool = ThreadPoolExecutor(self.thread_workers, thread_name_prefix="recommender")
+            return self.thread_pool
+        if self.process_pool is None:
+            # forking once the thread pool and the dataset warm-up are running can deadlock the children
+            self.process_pool = ProcessPoolExecutor(self.process_workers,
+                                                    mp_context=multiprocessing.get_context("spawn"))
+        return self.process_pool
+
+    async def run_thread(self, func, *args, timeout=None, **kwargs):
+        return await self._run("thread", func, args, kwargs, timeout)
+
+    async def run_process(self, func, *args, timeout=None, **kwargs):
+        """Run func in a worker process; func and its arguments must be picklable"""
+        return await self._run("process", func, args, kwargs, timeout)
+
+    async def _run(self, kind, func, args, kwargs, timeout):
+        if self.pending[kind] >= self.max_pending:
+            self.rejected[kind] += 1
+            raise WorkerBusyError(f"{self.pending[kind]} {kind} jobs already pending")
+
+        work = self.executor(kind).submit(functools.partial(func, *args, **kwargs))
+        with self.pending_lock:
+            self.pending[kind] += 1
+        # the slot is freed when the job ends in its worker, not when the caller stops waiting for it
+        work.add_done_callback(functools.partial(self.release, kind))
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(work), timeout or self.timeout)
+        except TimeoutError:
+            self.timeouts[kind] += 1
+            raise
+        except Exception:
+            self.failed[kind] += 1
+            raise
+        finally:
+            self.latency[kind].record((time.perf_counter() - start) * 1000)
+        self.completed[kind] += 1
+        return result
+
+    def release(self, kind, work):
+        with self.pending_lock:
+            self.pending[kind] -= 1
+
+    def stats(self):
+        return {kind: {"pending": self.pending[kind], "completed": self.completed[kind], "failed": self.failed[kind],
+                       "rejected": self.rejected[kind], "timeouts": self.timeouts[kind],
+                       "p50_ms": self.latency[kind].percentile(50), "p99_ms": self.latency[kind].percentile(99)}
+                for kind in self.pending}
+
+    def shutdown(self):
+        for pool in (self.thread_pool, self.process_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up from a fixed sleep.
+
+    Anything blocking the loop (a slow command, a long pandas call) shows
+    up directly as lag.
+    """
+
+    def __init__(self, interval=LAG_INTERVAL):
+        self.interval = interval
+        self.lag = LatencyTracker()
+        self.task = None
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self._run())
+        return self.task
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lag.record(max(0.0, loop.time() - start - self.interval) * 1000)
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()